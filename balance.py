@@ -0,0 +1,224 @@
+"""
+Batch simulator for the balancing of the levels: plays every level with every
+combination of tuning values, headless and on all the cores, and reports the
+clear time, deaths, projectiles fired and frame times of each combination.
+
+    python balance.py --runs 8
+    python balance.py --maps 0 2 --set walk_chance=0.005,0.01,0.02 --set dash_duration=50,60 --out sweep.json
+    python balance.py --policy run.njrp --runs 1
+
+Run i of every level and combination uses the seed --seed + i, for the game and
+for the inputs, so the combinations are compared on the same random draws.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.inputs import FrameInput, NO_INPUT
+from scripts.levels import map_paths
+from scripts.profiler import percentile
+from scripts.replay import Recording
+from scripts.tuning import DEFAULT_TUNING
+
+TICKS_PER_SECOND = 60
+
+
+def seek_inputs(game, rng):
+    """
+    Bot walking to the nearest enemy and dashing through it, jumping over the walls
+    """
+    while True:
+        player = game.player
+        target = min(game.enemies, key=lambda enemy: abs(enemy.pos[0] - player.pos[0]) + abs(enemy.pos[1] - player.pos[1]), default=None)
+        if target is None or game.dead:
+            yield NO_INPUT
+            continue
+        dx = target.pos[0] - player.pos[0]
+        dy = target.pos[1] - player.pos[1]
+        # le dash part dans la direction ou regarde le joueur
+        facing = (dx < 0) == player.flip
+        dash = abs(dx) < 64 and abs(dy) < 16 and facing and rng.random() < 0.5
+        blocked = player.collisions['left'] or player.collisions['right']
+        jump = blocked or (dy < -16 and rng.random() < 0.05) or rng.random() < 0.01
+        yield FrameInput(dx < -4, dx > 4, jump, dash)
+
+
+def random_inputs(game, rng):
+    """
+    Random key presses: a direction held for a random time, random jumps and dashes
+    """
+    direction = hold = 0
+    while True:
+        if hold <= 0:
+            direction = rng.choice((-1, 0, 1))
+            hold = rng.randint(10, 90)
+        hold -= 1
+        yield FrameInput(direction < 0, direction > 0, rng.random() < 0.03, rng.random() < 0.01)
+
+
+POLICIES = {'seek': seek_inputs, 'random': random_inputs}
+
+
+def make_inputs(policy, game, rng):
+    """
+    Returns the endless iterator of FrameInput of a policy name or of a replay file
+    (the recorded inputs, then no input)
+    """
+    if policy in POLICIES:
+        return POLICIES[policy](game, rng)
+    return itertools.chain(Recording.load(policy).frame_inputs(), itertools.repeat(NO_INPUT))
+
+
+def run_level(level, params, seed, ticks, policy, render=False):
+    """
+    Plays a level until all its enemies are killed or for a number of ticks
+
+    :param params: dict of Tuning fields changed from DEFAULT_TUNING
+    :param policy: name of a policy of POLICIES or path of a replay file
+
+    return : dict with the results of the run, frame_times being the time of each tick in ms
+    """
+    from game import Game
+
+    game = Game(headless=True, seed=seed, level=level, tuning=DEFAULT_TUNING._replace(**params))
+    inputs = make_inputs(policy, game, random.Random(seed))
+    frame_times = []
+    deaths = 0
+    kills = 0
+    clear_tick = None
+    for _ in range(ticks):
+        was_dead = game.dead
+        enemies = len(game.enemies)
+        start = time.perf_counter()
+        game.step(next(inputs))
+        if render:
+            game.render()
+        frame_times.append((time.perf_counter() - start) * 1000)
+        if game.dead and not was_dead:
+            deaths += 1
+        # au respawn (dead remis a 0) les ennemis du niveau reviennent, ce n'est pas un kill
+        if not (was_dead and not game.dead):
+            kills += max(0, enemies - len(game.enemies))
+        if not game.enemies:
+            clear_tick = game.tick
+            break
+    return {
+        'level': level,
+        'params': params,
+        'seed': seed,
+        'ticks': len(frame_times),
+        'clear_time': None if clear_tick is None else clear_tick / TICKS_PER_SECOND,
+        'deaths': deaths,
+        'kills': kills,
+        'fired': game.projectiles.fired,
+        'frame_times': frame_times,
+    }
+
+
+def _run_job(job):
+    return run_level(*job)
+
+
+def summarize(runs):
+    """
+    Aggregates the runs of one level and tuning combination
+    """
+    clear_times = [run['clear_time'] for run in runs if run['clear_time'] is not None]
+    frame_times = [t for run in runs for t in run['frame_times']]
+    return {
+        'level': runs[0]['level'],
+        'params': runs[0]['params'],
+        'runs': len(runs),
+        'cleared': len(clear_times),
+        'clear_time_median': statistics.median(clear_times) if clear_times else None,
+        'clear_time_mean': statistics.fmean(clear_times) if clear_times else None,
+        'deaths_mean': statistics.fmean(run['deaths'] for run in runs),
+        'kills_mean': statistics.fmean(run['kills'] for run in runs),
+        'fired_mean': statistics.fmean(run['fired'] for run in runs),
+        'frame_mean': statistics.fmean(frame_times) if frame_times else 0.0,
+        'frame_p50': percentile(frame_times, 50),
+        'frame_p99': percentile(frame_times, 99),
+    }
+
+
+def parse_set(text):
+    """
+    Parses a --set option, name=value,value... with the type of the field in DEFAULT_TUNING
+    """
+    name, _, values = text.partition('=')
+    if name not in DEFAULT_TUNING._fields or not values:
+        raise argparse.ArgumentTypeError('expected name=value[,value...] with name in ' + ', '.join(DEFAULT_TUNING._fields))
+    field_type = type(getattr(DEFAULT_TUNING, name))
+    try:
+        return name, [field_type(value) for value in values.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid value for ' + name + ': ' + values)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch simulator for level balancing')
+    parser.add_argument('--maps', type=int, nargs='+', help='ids of the levels to play (all the levels of data/maps by default)')
+    parser.add_argument('--set', type=parse_set, action='append', default=[], metavar='NAME=V1,V2', help='tuning values to sweep, the runs use every combination')
+    parser.add_argument('--runs', type=int, default=4, help='runs per level and combination')
+    parser.add_argument('--ticks', type=int, default=120 * TICKS_PER_SECOND, help='max ticks of a run')
+    parser.add_argument('--policy', default='seek', help='inputs of the player: ' + ', '.join(POLICIES) + ' or the path of a replay file')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--render', action='store_true', help='also draw each frame off-screen, for the frame times')
+    parser.add_argument('--out', help='JSON file for the report')
+    args = parser.parse_args(argv)
+
+    levels = args.maps if args.maps else sorted(map_paths())
+    names = [name for name, _ in args.set]
+    combinations = [dict(zip(names, values)) for values in itertools.product(*(values for _, values in args.set))]
+    jobs = [(level, params, args.seed + i, args.ticks, args.policy, args.render)
+            for level in levels for params in combinations for i in range(args.runs)]
+
+    start = time.perf_counter()
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            runs = list(executor.map(_run_job, jobs))
+    else:
+        runs = [_run_job(job) for job in jobs]
+    duration = time.perf_counter() - start
+
+    groups = [summarize(runs[i:i + args.runs]) for i in range(0, len(runs), args.runs)]
+
+    print('%-6s %-32s %7s %8s %7s %7s %7s %9s %9s' % ('level', 'params', 'cleared', 'clear s', 'deaths', 'kills', 'fired', 'frame ms', 'p99 ms'))
+    for group in groups:
+        params = ' '.join('%s=%s' % item for item in group['params'].items()) or 'default'
+        clear = '-' if group['clear_time_median'] is None else '%.1f' % group['clear_time_median']
+        print('%-6d %-32s %3d/%-3d %8s %7.2f %7.1f %7.1f %9.3f %9.3f' % (
+            group['level'], params, group['cleared'], group['runs'], clear,
+            group['deaths_mean'], group['kills_mean'], group['fired_mean'], group['frame_mean'], group['frame_p99']))
+    total_ticks = sum(run['ticks'] for run in runs)
+    print(f'{len(runs)} runs, {total_ticks} ticks in {duration:.1f}s ({total_ticks / max(duration, 1e-9):.0f} ticks/s, {args.workers} workers)')
+
+    if args.out:
+        report = {
+            'meta': {
+                'tuning': DEFAULT_TUNING._asdict(),
+                'sweep': dict(args.set),
+                'runs': args.runs,
+                'ticks': args.ticks,
+                'policy': args.policy,
+                'seed': args.seed,
+                'workers': args.workers,
+                'render': args.render,
+                'duration': duration,
+            },
+            'results': groups,
+            'runs': [{key: value for key, value in run.items() if key != 'frame_times'} for run in runs],
+        }
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import math
+
+import numpy as np
+import pygame
+
+from benchmarks.common import SEED, get_game, measure
+from scripts.outline import Outline
+from scripts.parallax import Parallax, CloudLayer
+from scripts.particles import ParticleSystem
+from scripts.spark import SparkSystem
+
+SIZES = (1000, 10000, 100000)
+
+
+def _particles(count):
+    game = get_game()
+    particles = ParticleSystem({'leaf': game.assets['particles/leaf'], 'particle': game.assets['particles/particle']}, capacity=count)
+    rng = np.random.default_rng(SEED)
+    half = count // 2
+    particles.spawn_many('leaf', rng.uniform(0, 320, (half, 2)), rng.uniform(-1, 1, (half, 2)), rng.integers(0, 20, half))
+    particles.spawn_many('particle', rng.uniform(0, 320, (count - half, 2)), rng.uniform(-1, 1, (count - half, 2)), rng.integers(0, 7, count - half))
+    return particles
+
+
+def _sparks(count):
+    sparks = SparkSystem(capacity=count)
+    rng = np.random.default_rng(SEED)
+    sparks.spawn_many(rng.uniform(0, 320, (count, 2)), rng.uniform(0, math.pi * 2, count), rng.uniform(2, 5, count))
+    return sparks
+
+
+def _update(factory, count):
+    def bench(quick):
+        """update() of the whole pool, rebuilt full before each measure (not timed)"""
+        state = {}
+
+        def refill():
+            state['pool'] = factory(count)
+
+        return measure(lambda: state['pool'].update(), number=5 if quick else 20, setup=refill)
+    return bench
+
+
+def _render(factory, count):
+    def bench(quick):
+        """render() of the whole pool on a 320x240 surface"""
+        pool = factory(count)
+        surf = pygame.Surface((320, 240), pygame.SRCALPHA)
+        return measure(lambda: pool.render(surf), number=1 if count >= 100000 else 5, repeat=3 if quick else 5)
+    return bench
+
+
+def bench_projectiles(count):
+    def bench(quick):
+        """ProjectileSystem.update (move, tile and player tests) for a pool refilled every tick"""
+        game = get_game()
+        projectiles = game.projectiles
+        rng = np.random.default_rng(SEED)
+        positions = rng.uniform(0, 320, (count, 2))
+        directions = np.zeros((count, 2))
+        directions[:, 0] = rng.choice((-1, 1), count)
+        target = pygame.Rect(100, 100, 8, 15)
+
+        def update():
+            projectiles.clear()
+            projectiles.spawn_many(positions, directions)
+            projectiles.update(game.tilemap, target)
+
+        return measure(update, number=5 if quick else 20)
+    return bench
+
+
+def bench_outline(quick):
+    """Silhouette outline of a display filled like a level"""
+    game = get_game()
+    display = pygame.Surface((320, 240), pygame.SRCALPHA)
+    game.tilemap.render(display, offset=(0, 0))
+    target = pygame.Surface((320, 240))
+    outline = Outline(display.get_size())
+
+    def render():
+        outline.update(display)
+        outline.render(target)
+
+    return measure(render, number=20 if quick else 100)
+
+
+def bench_background(moving):
+    def bench(quick):
+        """Parallax.render of 5 layers of 40 clouds, with a moving or a still camera"""
+        game = get_game()
+        layers = [CloudLayer(0.1 + 0.15 * i, 0.05, 40) for i in range(5)]
+        background = Parallax(game.assets['background'], game.assets['clouds'], (320, 240), layers=layers, seed=SEED)
+        surf = pygame.Surface((320, 240))
+        state = {'x': 0}
+
+        def render():
+            if moving:
+                state['x'] += 1
+            background.render(surf, offset=(state['x'], 0))
+
+        return measure(render, number=20 if quick else 100)
+    return bench
+
+
+BENCHMARKS = []
+for count in SIZES:
+    BENCHMARKS.append(('particles.update_%d' % count, _update(_particles, count)))
+    BENCHMARKS.append(('particles.render_%d' % count, _render(_particles, count)))
+    BENCHMARKS.append(('sparks.update_%d' % count, _update(_sparks, count)))
+    BENCHMARKS.append(('sparks.render_%d' % count, _render(_sparks, count)))
+    BENCHMARKS.append(('projectiles.update_%d' % count, bench_projectiles(count)))
+BENCHMARKS.append(('outline', bench_outline))
+BENCHMARKS.append(('background.render_still', bench_background(False)))
+BENCHMARKS.append(('background.render_moving', bench_background(True)))
@@ -0,0 +1,30 @@
+import random
+
+from benchmarks.common import SEED, get_game, measure, synthetic_tilemap
+from scripts.entities import PhysicsEntity, Enemy
+from scripts.tilemap import Tilemap
+
+
+def _entities_update(count):
+    game = get_game()
+    width, height = 200, 60
+    tilemap = synthetic_tilemap(Tilemap(game, tile_size=16), width, height)
+    rng = random.Random(SEED)
+    enemies = [Enemy(game, (rng.uniform(0, width * 16), rng.uniform(0, height * 16)), (8, 15)) for _ in range(count)]
+    movements = [(rng.choice((-0.5, 0, 0.5)), 0) for _ in range(count)]
+
+    def update():
+        for enemy, movement in zip(enemies, movements):
+            PhysicsEntity.update(enemy, tilemap, movement)
+
+    return update
+
+
+def bench_update(count):
+    def bench(quick):
+        """PhysicsEntity.update (tile collisions, gravity, animation) for every entity"""
+        return measure(_entities_update(count), number=20 if quick else 100)
+    return bench
+
+
+BENCHMARKS = [('entities.update_%d' % count, bench_update(count)) for count in (10, 100, 1000)]
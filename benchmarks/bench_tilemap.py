@@ -0,0 +1,133 @@
+import math
+
+import numpy as np
+import pygame
+
+from benchmarks.common import get_game, measure, synthetic_tilemap, random_positions
+from scripts.tilemap import Tilemap
+
+
+def _map(width, height):
+    game = get_game()
+    return synthetic_tilemap(Tilemap(game, tile_size=16), width, height)
+
+
+def render_per_tile(tilemap, surf, offset):
+    """
+    Reference rendering of a tilemap, one blit per tile, without the baked chunks
+    """
+    assets = tilemap.game.assets
+    for tile in tilemap.offgrid_tiles:
+        surf.blit(assets[tile['type']][tile['variant']], (math.floor(tile['pos'][0]) - offset[0], math.floor(tile['pos'][1]) - offset[1]))
+    tile_size = tilemap.tile_size
+    # une case avant l'ecran : ses images peuvent deborder a droite et en bas
+    for x in range(offset[0] // tile_size - 1, (offset[0] + surf.get_width()) // tile_size + 1):
+        for y in range(offset[1] // tile_size - 1, (offset[1] + surf.get_height()) // tile_size + 1):
+            tile = tilemap.get_tile((x, y))
+            if tile is not None:
+                surf.blit(assets[tile['type']][tile['variant']], (x * tile_size - offset[0], y * tile_size - offset[1]))
+
+
+def check_render(tilemap, size, offsets):
+    """
+    Checks that Tilemap.render draws the same pixels as render_per_tile
+
+    raise : AssertionError with the number of different pixels at the first offset that differs
+    """
+    for offset in offsets:
+        baked = pygame.Surface(size, pygame.SRCALPHA)
+        reference = pygame.Surface(size, pygame.SRCALPHA)
+        tilemap.render(baked, offset=offset)
+        render_per_tile(tilemap, reference, offset)
+        different = int(np.count_nonzero((pygame.surfarray.array3d(baked) != pygame.surfarray.array3d(reference)).any(axis=2)
+                                         | (pygame.surfarray.array_alpha(baked) != pygame.surfarray.array_alpha(reference))))
+        assert different == 0, f'Tilemap.render differs from the per-tile rendering by {different} pixels at offset {offset}'
+
+
+def bench_render(quick):
+    """Tilemap.render on a 320x240 surface while scrolling across a big map"""
+    width, height = (200, 60) if quick else (1000, 100)
+    tilemap = _map(width, height)
+    surf = pygame.Surface((320, 240), pygame.SRCALPHA)
+    tilemap.set_view_size(surf.get_size())
+    offsets = [(x * 3, (x * 2) % (height * 16 - 240)) for x in range((width * 16 - 320) // 3)]
+    state = {'i': 0}
+    check_render(tilemap, surf.get_size(), offsets[::len(offsets) // 20 + 1] + [(-40, -30), (-7, 5)])
+
+    def render():
+        offset = offsets[state['i'] % len(offsets)]
+        state['i'] += 1
+        surf.fill((0, 0, 0, 0))
+        tilemap.render(surf, offset=offset)
+
+    return measure(render, number=200, repeat=5)
+
+
+def bench_solid_check(quick):
+    """Tilemap.solid_check on random positions, time per 1000 calls"""
+    tilemap = _map(200, 60)
+    positions = random_positions(tilemap, 1000, 200, 60)
+
+    def check():
+        for pos in positions:
+            tilemap.solid_check(pos)
+
+    return measure(check, number=10 if quick else 50)
+
+
+def bench_physics_rect_around(quick):
+    """Tilemap.physics_rect_around on random positions, time per 1000 calls"""
+    tilemap = _map(200, 60)
+    positions = random_positions(tilemap, 1000, 200, 60)
+
+    def query():
+        for pos in positions:
+            tilemap.physics_rect_around(pos)
+
+    return measure(query, number=10 if quick else 50)
+
+
+def bench_load(quick, path='data/maps/2.json'):
+    """Tilemap.load of a shipped map"""
+    tilemap = Tilemap(get_game(), tile_size=16)
+    return measure(lambda: tilemap.load(path), number=10 if quick else 50)
+
+
+def bench_load_huge(quick):
+    """Tilemap.load of a big synthetic map saved as JSON"""
+    import os
+    import tempfile
+    width, height = (300, 100) if quick else (2000, 200)
+    tilemap = _map(width, height)
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        tilemap.save(path)
+        return measure(lambda: Tilemap(get_game(), tile_size=16).load(path), repeat=3)
+    finally:
+        os.remove(path)
+
+
+def bench_autotile(quick):
+    """Tilemap.autotile on a shipped map"""
+    tilemap = Tilemap(get_game(), tile_size=16)
+    tilemap.load('data/maps/2.json')
+    return measure(tilemap.autotile, number=10 if quick else 50)
+
+
+def bench_autotile_huge(quick):
+    """Tilemap.autotile on a big synthetic map"""
+    width, height = (300, 100) if quick else (2000, 200)
+    tilemap = _map(width, height)
+    return measure(tilemap.autotile, repeat=3)
+
+
+BENCHMARKS = [
+    ('tilemap.render', bench_render),
+    ('tilemap.solid_check_x1000', bench_solid_check),
+    ('tilemap.physics_rect_around_x1000', bench_physics_rect_around),
+    ('tilemap.load_small', bench_load),
+    ('tilemap.load_huge', bench_load_huge),
+    ('tilemap.autotile_small', bench_autotile),
+    ('tilemap.autotile_huge', bench_autotile_huge),
+]
@@ -0,0 +1,85 @@
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+SEED = 1234
+
+_game = None
+
+
+def get_game():
+    """
+    Returns a headless Game shared by all the benchmarks (loading the assets once)
+    """
+    global _game
+    if _game is None:
+        from game import Game
+        _game = Game(headless=True, seed=SEED)
+    return _game
+
+
+def measure(fn, number=1, repeat=5, warmup=1, setup=None):
+    """
+    Times fn() and returns statistics in seconds per call
+
+    :param number: calls per measure
+    :param repeat: number of measures
+    :param warmup: calls made before measuring
+    :param setup: called before the warmup and before each measure, not timed
+    """
+    if setup is not None:
+        setup()
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def synthetic_tilemap(tilemap, width, height, seed=SEED):
+    """
+    Fills a tilemap with random grass and stone platforms, decor and trees
+
+    :param width: width of the map in tiles
+    :param height: height of the map in tiles
+    """
+    rng = random.Random(seed)
+    tilemap.clear()
+    # sol continu en bas de la carte
+    for x in range(width):
+        tilemap.set_tile((x, height - 1), 'stone', 1)
+    # plateformes
+    for _ in range(width * height // 40):
+        x = rng.randrange(width)
+        y = rng.randrange(height - 1)
+        tile_type = rng.choice(('grass', 'stone'))
+        for dx in range(rng.randint(2, 8)):
+            tilemap.set_tile((x + dx, y), tile_type, 1)
+    for _ in range(width * height // 200):
+        tilemap.set_tile((rng.randrange(width), rng.randrange(height - 1)), 'decor', rng.randrange(4))
+    for _ in range(width * height // 400):
+        tilemap.add_offgrid({'type': 'large_decor', 'variant': rng.randrange(3), 'pos': [rng.uniform(0, width * tilemap.tile_size), rng.uniform(0, height * tilemap.tile_size)]})
+    tilemap.autotile()
+    return tilemap
+
+
+def random_positions(tilemap, count, width, height, seed=SEED):
+    rng = random.Random(seed)
+    return [(rng.uniform(0, width * tilemap.tile_size), rng.uniform(0, height * tilemap.tile_size)) for _ in range(count)]
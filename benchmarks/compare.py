@@ -0,0 +1,32 @@
+"""
+Compares two results files written by benchmarks.run
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark results')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print('%-40s %12s %12s %8s' % ('benchmark', 'before ms', 'after ms', 'ratio'))
+    for name, result in after['results'].items():
+        if name not in before['results']:
+            print('%-40s %12s %12.3f' % (name, '-', result['median'] * 1000))
+            continue
+        old = before['results'][name]['median']
+        new = result['median']
+        print('%-40s %12.3f %12.3f %7.2fx' % (name, old * 1000, new * 1000, old / new if new else float('inf')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Runs the benchmarks headless and writes the results as JSON.
+
+    python -m benchmarks.run --out results.json
+    python -m benchmarks.run --quick --filter tilemap
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+
+from benchmarks import common
+from benchmarks import bench_tilemap, bench_entities, bench_effects
+
+MODULES = [bench_tilemap, bench_entities, bench_effects]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Engine benchmarks')
+    parser.add_argument('--out', help='JSON file for the results (printed only if omitted)')
+    parser.add_argument('--filter', default='', help='only run the benchmarks whose name contains this text')
+    parser.add_argument('--quick', action='store_true', help='smaller maps and fewer iterations')
+    args = parser.parse_args(argv)
+
+    import numpy
+    import pygame
+
+    results = {}
+    for module in MODULES:
+        for name, bench in module.BENCHMARKS:
+            if args.filter not in name:
+                continue
+            result = bench(args.quick)
+            results[name] = result
+            print('%-40s %10.3f ms (min %.3f)' % (name, result['median'] * 1000, result['min'] * 1000), flush=True)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'seed': common.SEED,
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,36 +1,48 @@
 import sys
+import os
+import argparse
 import pygame
 
-from scripts.tilemap import Tilemap
-from scripts.utils import load_images
+from scripts.tilemap import Tilemap, AUTOTILE_TYPE
+from scripts.assets import load_assets, EDITOR_ASSETS
+from scripts.levels import MAPS_PATH, map_paths
+from scripts.mapsaver import MapSaver, autosave_path
 
 RENDER_SCALE = 2.0
 
+# intervalle par defaut entre deux sauvegardes automatiques, en secondes
+AUTOSAVE_INTERVAL = 60
+
 class Editor:
-    def __init__(self):
+    def __init__(self, path, autosave=AUTOSAVE_INTERVAL):
+        """
+        :param path: map edited, created if it does not exist (.json or .njm)
+        :param autosave: seconds between two saves of the modified map to its autosave file (0: no autosave)
+        """
         pygame.init()
 
-        pygame.display.set_caption('editor')
+        self.path = path
+        self.caption = None
         self.screen = pygame.display.set_mode((640, 480))
         self.display = pygame.Surface((320, 240))
 
         self.clock = pygame.time.Clock()
 
-        self.assets = {
-            'grass' : load_images('tiles/grass'),
-            'stone' : load_images('tiles/stone'),
-            'decor' : load_images('tiles/decor'),
-            'large_decor' : load_images('tiles/large_decor'),
-            'spawners' : load_images('tiles/spawners')
-        }
+        self.assets = load_assets(EDITOR_ASSETS)
 
         self.movement = [False, False, False, False]
         
         self.tilemap = Tilemap(self, tile_size=16)
         try:
-            self.tilemap.load('data/maps/3.json')
+            self.tilemap.load(path)
         except FileNotFoundError:
             pass
+        self.tilemap.set_view_size(self.display.get_size())
+
+        self.saver = MapSaver(self.tilemap, path)
+        self.autosave = autosave * 1000
+        self.last_autosave = pygame.time.get_ticks()
+        self.autosaved_revision = self.tilemap.revision
 
         self.scroll = [0, 0]
 
@@ -42,11 +54,30 @@ class Editor:
         self.right_clicking = False
         self.shift = False
         self.ongrid = True
-
+        # autotile des cases modifiees a chaque coup de pinceau (T pour activer/desactiver)
+        self.autotiling = True
+
+
+    def update_saves(self):
+        """
+        Finishes the background saves, starts the autosave when it is time, and shows the state of the map in the caption
+        """
+        self.saver.poll()
+        now = pygame.time.get_ticks()
+        if self.autosave and now - self.last_autosave >= self.autosave and self.saver.modified and self.tilemap.revision != self.autosaved_revision and not self.saver.busy:
+            self.saver.save(autosave_path(self.path))
+            self.last_autosave = now
+            self.autosaved_revision = self.tilemap.revision
+
+        caption = 'editor - ' + os.path.basename(self.path) + ('*' if self.saver.modified else '') + (' (saving)' if self.saver.busy else '')
+        if caption != self.caption:
+            pygame.display.set_caption(caption)
+            self.caption = caption
 
     def run(self):
         while True:
-            
+            self.update_saves()
+
             self.display.fill((0, 0, 0))
 
             self.scroll[0] += (self.movement[1] - self.movement[0]) * 5
@@ -70,15 +101,17 @@ class Editor:
                 self.display.blit(current_tile_img, (mpos[0] - self.tilemap.tile_size / 2, mpos[1] - self.tilemap.tile_size / 2))
 
             if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
+                tile_type = self.tile_list[self.tile_group]
+                tile = self.tilemap.get_tile(tile_pos)
+                # avec l'autotile, la variante de l'herbe et de la pierre est choisie par autotile_at : seul le type compte
+                if tile is None or tile['type'] != tile_type or not (self.autotiling and tile_type in AUTOTILE_TYPE):
+                    if self.tilemap.set_tile(tile_pos, tile_type, self.tile_variant) and self.autotiling:
+                        self.tilemap.autotile_at(tile_pos)
             if self.right_clicking:
-                if str(tile_pos[0]) + ';' + str(tile_pos[1]) in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])]
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1], tile_img.get_width(), tile_img.get_height())
-                    if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                if self.tilemap.remove_tile(tile_pos) and self.autotiling:
+                    self.tilemap.autotile_at(tile_pos)
+                for tile_id in self.tilemap.offgrid_at((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])):
+                    self.tilemap.remove_offgrid(tile_id)
 
             self.display.blit(current_tile_img, (5,5))
             
@@ -86,6 +119,8 @@ class Editor:
             for event in pygame.event.get():
                 
                 if event.type == pygame.QUIT:
+                    # les sauvegardes en cours sont terminees avant de quitter
+                    self.saver.close()
                     pygame.quit()
                     sys.exit()
 
@@ -111,7 +146,7 @@ class Editor:
                     if event.button == 1:
                         self.clicking = False
                         if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] - self.tilemap.tile_size / 2 + self.scroll[0], mpos[1] - self.tilemap.tile_size /2 + self.scroll[1])})
+                            self.tilemap.add_offgrid({'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] - self.tilemap.tile_size / 2 + self.scroll[0], mpos[1] - self.tilemap.tile_size /2 + self.scroll[1])})
                     if event.button == 3:
                         self.right_clicking = False
 
@@ -129,9 +164,11 @@ class Editor:
                     if event.key == pygame.K_g:
                         self.ongrid = not self.ongrid
                     if event.key == pygame.K_RETURN:
-                        self.tilemap.save('data/maps/tilemap.json')
+                        self.saver.save()
                     if event.key == pygame.K_t:
-                        self.tilemap.autotile()
+                        self.autotiling = not self.autotiling
+                        if self.autotiling:
+                            self.tilemap.autotile()
                 if event.type == pygame.KEYUP:
                     if event.key == pygame.K_q:
                         self.movement[0] = False
@@ -149,4 +186,15 @@ class Editor:
             pygame.display.update()
             self.clock.tick(60)
 
-Editor().run()
\ No newline at end of file
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Map editor')
+    parser.add_argument('map', nargs='?', default='0', help='id of a level of ' + MAPS_PATH + ' or path of a map (.json or .njm)')
+    parser.add_argument('--autosave', type=float, default=AUTOSAVE_INTERVAL, metavar='SECONDS', help='interval of the autosaves of the modified map to <map>.autosave.<ext> (0: off)')
+    args = parser.parse_args()
+
+    if args.map.isdigit():
+        path = map_paths().get(int(args.map), os.path.join(MAPS_PATH, args.map + '.json'))
+    else:
+        path = args.map
+    Editor(path, autosave=args.autosave).run()
\ No newline at end of file
@@ -3,103 +3,171 @@ import pygame
 import random
 import math
 import os
+import itertools
+import argparse
+import time
+import zlib
 
 from scripts.entities  import PhysicsEntity, Player, Enemy
-from scripts.tilemap import Tilemap
-from scripts.clouds import Clouds
-from scripts.utils import load_image, load_images, Animation
-from scripts.spark import Spark
-from scripts.particles import Particle
+from scripts.levels import LevelManager
+from scripts.parallax import Parallax, CLOUD_LAYERS
+from scripts.utils import SilentSound
+from scripts.assets import load_assets, GAME_ASSETS
+from scripts.spark import SparkSystem
+from scripts.particles import ParticleSystem
+from scripts.projectiles import ProjectileSystem, ProjectileKind
+from scripts.outline import Outline
+from scripts.inputs import FrameInput, NO_INPUT
+from scripts.profiler import FrameProfiler
+from scripts.replay import InputRecorder, Recording, replay
+from scripts.snapshot import GameSnapshot, SnapshotRing
+from scripts.tuning import DEFAULT_TUNING
+from scripts.spatial import Broadphase
+
+
+# deplacement max d'un ennemi en un tick (vitesse de marche + chute), pour les tests de dash
+DASH_MARGIN = 8
+
+# les ennemis a plus de LOD_RADIUS pixels de l'ecran ne sont plus simules completement :
+# seuls leurs timers avancent, tous les LOD_INTERVAL ticks
+LOD_RADIUS = 256
+LOD_INTERVAL = 8
+# marge autour de l'ecran pour le rendu des ennemis (sprite et arme)
+RENDER_MARGIN = 32
+
+# resolution interne du jeu et facteur d'agrandissement de la fenetre
+RESOLUTION = (320, 240)
+OUTPUT_SCALE = 2
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, headless=False, seed=None, level=0, history=0, lod_radius=LOD_RADIUS, resolution=RESOLUTION, scale=OUTPUT_SCALE, scaled=False, tuning=DEFAULT_TUNING, cloud_layers=CLOUD_LAYERS):
+        """
+        :param headless: run without a window or sound (SDL dummy drivers), for simulations
+        :param seed: seed of the game RNG, a run is reproducible from its seed and inputs
+        :param level: id of the first level
+        :param history: number of ticks kept to rewind the game (a snapshot is taken every tick if > 0)
+        :param lod_radius: distance to the screen beyond which enemies are simulated coarsely (None: every enemy is fully simulated)
+        :param resolution: (width, height) of the internal display the game is drawn on
+        :param scale: size of a display pixel in the window
+        :param scaled: let SDL scale the display to the window (pygame.SCALED, integer factor chosen by SDL, scale is ignored)
+        :param tuning: Tuning with the gameplay constants (enemy walks, dash, projectiles)
+        :param cloud_layers: CloudLayer of each depth band of the background
+        """
+        self.headless = headless
+        self.tuning = tuning
+        # la seed est ramenee sur 64 bits, la taille qu'elle a dans un replay
+        self.seed = seed % 2**64 if seed is not None else random.randrange(2**32)
+        # tout l'aleatoire de la simulation passe par ce generateur (l'ecran qui tremble utilise random)
+        self.rng = random.Random(self.seed)
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
         pygame.init()
 
-        self.screen = pygame.display.set_mode((640, 480))
-        self.display = pygame.Surface((320, 240), pygame.SRCALPHA)
-        self.display_2 = pygame.Surface((320, 240))
+        # le driver dummy ne sait pas faire de rendu mis a l'echelle
+        self.scaled = scaled and not headless
+        if self.scaled:
+            self.screen = pygame.display.set_mode(resolution, pygame.SCALED | pygame.RESIZABLE)
+            self.scale = 1
+        else:
+            self.screen = pygame.display.set_mode((resolution[0] * scale, resolution[1] * scale))
+            self.scale = scale
+        self.display = pygame.Surface(resolution, pygame.SRCALPHA)
+        self.display_2 = pygame.Surface(resolution)
+        # tampon de l'image agrandie, reutilise a chaque frame (inutile si SDL met a l'echelle)
+        self.scale_buffer = None if self.scaled else pygame.Surface(self.screen.get_size(), 0, self.display_2)
+        # masques de la transition par rayon, le cercle grandit de transition_step pixels par tick
+        self.transition_masks = {}
+        self.transition_step = max(8, math.ceil(math.hypot(*resolution) / 60))
+        self.win_text = None
+        self.outline = Outline(self.display.get_size())
 
         self.clock = pygame.time.Clock()
+        self.profiler = FrameProfiler()
 
         self.movement = [False, False]
 
-        self.assets = {
-            'grass' : load_images('tiles/grass'),
-            'stone' : load_images('tiles/stone'),
-            'decor' : load_images('tiles/decor'),
-            'large_decor' : load_images('tiles/large_decor'),
-            'player': load_image('entities/player.png'),
-            'background' : load_image('background.png'),
-            'clouds' : load_images('clouds'),
-            'gun' : load_image('gun.png'),
-            'projectile' : load_image('projectile.png'),
-            'enemy/idle' : Animation(load_images('entities/enemy/idle'), img_dur=6),
-            'enemy/run' : Animation(load_images('entities/enemy/run'), img_dur=4),
-            'player/idle' : Animation(load_images('entities/player/idle'), img_dur=6),
-            'player/run' : Animation(load_images('entities/player/run'), img_dur=4),
-            'player/jump' : Animation(load_images('entities/player/jump')),
-            'player/slide': Animation(load_images('entities/player/slide')),
-            'player/wallslide': Animation(load_images('entities/player/wall_slide')),
-            'particles/leaf' : Animation(load_images('particles/leaf'), img_dur=20, loop=False),
-            'particles/particle' : Animation(load_images('particles/particle'), img_dur=6, loop=False)
-        
-        }
+        self.assets = load_assets(GAME_ASSETS)
+        self.assets['gun/flipped'] = pygame.transform.flip(self.assets['gun'], True, False)
 
-        self.sfx = {
-            'jump' : pygame.mixer.Sound('data/sfx/jump.wav'),
-            'dash' : pygame.mixer.Sound('data/sfx/dash.wav'),
-            'shoot' : pygame.mixer.Sound('data/sfx/shoot.wav'),
-            'ambience' : pygame.mixer.Sound('data/sfx/ambience.wav'),
-            'hit' : pygame.mixer.Sound('data/sfx/hit.wav')
-        }
+        if headless:
+            self.sfx = {name : SilentSound() for name in ['jump', 'dash', 'shoot', 'ambience', 'hit']}
+        else:
+            self.sfx = {
+                'jump' : pygame.mixer.Sound('data/sfx/jump.wav'),
+                'dash' : pygame.mixer.Sound('data/sfx/dash.wav'),
+                'shoot' : pygame.mixer.Sound('data/sfx/shoot.wav'),
+                'ambience' : pygame.mixer.Sound('data/sfx/ambience.wav'),
+                'hit' : pygame.mixer.Sound('data/sfx/hit.wav')
+            }
 
-        self.sfx['ambience'].set_volume(0)
-        self.sfx['dash'].set_volume(0.3)
-        self.sfx['jump'].set_volume(0.7)
-        self.sfx['shoot'].set_volume(0.4)
-        self.sfx['hit'].set_volume(0.8)
+            self.sfx['ambience'].set_volume(0)
+            self.sfx['dash'].set_volume(0.3)
+            self.sfx['jump'].set_volume(0.7)
+            self.sfx['shoot'].set_volume(0.4)
+            self.sfx['hit'].set_volume(0.8)
 
 
-        self.clouds = Clouds(self.assets['clouds'], count = 8)
+        self.background = Parallax(self.assets['background'], self.assets['clouds'], self.display.get_size(), layers=cloud_layers, seed=self.seed)
+
+        self.sparks = SparkSystem()
+        self.particles = ParticleSystem({'leaf': self.assets['particles/leaf'], 'particle': self.assets['particles/particle']})
+        self.projectiles = ProjectileSystem({'bullet': ProjectileKind(speed=tuning.projectile_speed, lifetime=tuning.projectile_lifetime, image=self.assets['projectile'])})
 
         self.player = Player(self, (50, 50), (8,15))
         
-        self.tilemap = Tilemap(self,tile_size=16)
+        self.levels = LevelManager(self)
+        # index des ennemis et des zones de feuilles, pour les tests de proximite
+        self.broadphase = Broadphase()
+        # ennemis proches du joueur quand il dash, calcule avant l'update des ennemis
+        self.dash_targets = set()
+        self.lod_radius = lod_radius
+        # nombre d'ennemis simules completement au dernier tick
+        self.active_enemies = 0
+
+        self.level = level
+        self.tick = 0
+        self.won = False
+        self.screen_shake = 0
 
-        self.level = 0
+        # ennemis tues, reutilises par restore au lieu d'en recreer
+        self.enemy_pool = []
+        self.enemies = []
+        # etat du niveau courant a son debut, restaure au respawn
+        self.checkpoint = None
+        self.history = SnapshotRing(history) if history else None
 
         self.load_level(self.level)
 
-        self.screen_shake = 0
-
         
     def load_level(self, map_id = 0):
-
-        try:
-            self.tilemap.load('data/maps/'+str(map_id)+'.json')
-        except FileNotFoundError:
-            print("Map not found !")
-
-        self.leaf_spawners_trees = []
-        for tree  in self.tilemap.extract(([('large_decor',2)]),keep= True):
-            self.leaf_spawners_trees.append(pygame.Rect(tree['pos'][0] + 4 , tree['pos'][1] + 4, 23, 13))
-        
-        self.leaf_spawners_bushes = []
-        for bush  in self.tilemap.extract(([('large_decor',1)]),keep= True):
-            self.leaf_spawners_bushes.append(pygame.Rect(bush['pos'][0] + 3 , bush['pos'][1] + 3, 19, 9))
-
-        self.enemies = []
-        for spawner in self.tilemap.extract([('spawners',0),('spawners',1)],keep=False):
-            if spawner['variant'] == 0:
+        """
+        (Re)starts a level from its pristine state, kept in memory by the LevelManager
+        """
+        level = self.levels.get(map_id)
+        self.enter_level(level)
+
+        respawn = self.checkpoint is not None and self.checkpoint.level == map_id
+        if respawn:
+            # les ennemis reprennent leur etat de depart, sans etre recrees
+            self.restore_enemies(self.checkpoint.enemies)
+        else:
+            self.enemy_pool += self.enemies
+            self.enemies = []
+        for variant, pos in level.spawners:
+            if variant == 0:
                 self.player.air_time = 0
-                self.player.pos = spawner['pos']
-            else:
-                self.enemies.append(Enemy(self, spawner['pos'], (8, 15)))
+                self.player.pos = list(pos)
+            elif not respawn:
+                self.enemies.append(Enemy(self, pos, (8, 15), lod_phase=len(self.enemies)))
+        if not respawn:
+            self.index_enemies()
 
-        self.projectiles = []
-        self.particles = []
-        self.sparks = []
+        self.projectiles.clear()
+        self.particles.clear()
+        self.sparks.clear()
 
         self.scroll = [0, 0]
         self.dead = 0
@@ -108,138 +176,363 @@ class Game:
 
         self.transition = -30
 
+        if not respawn:
+            self.checkpoint = self.snapshot()
+
+    def view_rect(self):
+        """
+        Returns the area of the level shown on the screen
+        """
+        return pygame.Rect(int(self.scroll[0]), int(self.scroll[1]), self.display.get_width(), self.display.get_height())
+
+    def enter_level(self, level):
+        """
+        Switches to the tilemap and leaf spawners of a Level
+        """
+        # la tilemap du niveau n'est jamais modifiee en jeu, elle est partagee
+        self.tilemap = level.tilemap
+        self.tilemap.set_view_size(self.display.get_size())
+        self.leaf_spawners_trees = [pygame.Rect(rect) for rect in level.trees]
+        self.leaf_spawners_bushes = [pygame.Rect(rect) for rect in level.bushes]
+        # les zones ne bougent pas, leur index est celui du niveau
+        self.broadphase.layers['trees'] = level.tree_index
+        self.broadphase.layers['bushes'] = level.bush_index
+
+    def index_enemies(self):
+        """
+        Rebuilds the 'enemies' layer of the broadphase from self.enemies
+        """
+        self.broadphase.clear('enemies')
+        for enemy in self.enemies:
+            self.broadphase.insert('enemies', enemy, enemy.rect())
+
+    def restore_enemies(self, states):
+        """
+        Sets the enemies from a list of Enemy.get_state(), reusing the existing Enemy objects
+        """
+        enemies = self.enemies + self.enemy_pool
+        while len(enemies) < len(states):
+            enemies.append(Enemy(self, (0, 0), (8, 15)))
+        self.enemies = enemies[:len(states)]
+        self.enemy_pool = enemies[len(states):]
+        for enemy, state in zip(self.enemies, states):
+            enemy.set_state(state)
+        self.index_enemies()
+
+    def snapshot(self):
+        """
+        Returns the whole simulation state as a GameSnapshot, made of immutable values and array copies
+        """
+        return GameSnapshot(self.tick, self.level, self.dead, self.transition, self.screen_shake, self.won, tuple(self.scroll),
+                            self.player.get_state(), tuple(enemy.get_state() for enemy in self.enemies),
+                            self.projectiles.get_state(),
+                            self.particles.get_state(), self.sparks.get_state(), self.background.get_state(), self.rng.getstate())
+
+    def restore(self, snapshot):
+        """
+        Puts the game back in the state of a snapshot, the game then continues exactly as it did from there
+        """
+        if snapshot.level != self.level:
+            self.enter_level(self.levels.get(snapshot.level))
+        if self.checkpoint is not None and self.checkpoint.level != snapshot.level:
+            self.checkpoint = None
+        self.tick, self.level, self.dead, self.transition, self.screen_shake, self.won = snapshot[:6]
+        self.scroll = list(snapshot.scroll)
+        self.player.set_state(snapshot.player)
+        self.restore_enemies(snapshot.enemies)
+        self.projectiles.set_state(snapshot.projectiles)
+        self.particles.set_state(snapshot.particles)
+        self.sparks.set_state(snapshot.sparks)
+        self.background.set_state(snapshot.background)
+        self.rng.setstate(snapshot.rng)
+
+    def rewind(self, ticks=1):
+        """
+        Goes back in time by a number of ticks (at most the history given to the constructor)
+
+        return : True if the game was rewound
+        """
+        if self.history is None or len(self.history) < 2:
+            return False
+        self.restore(self.history.rewind(ticks))
+        return True
+
+
+    def step(self, inputs=NO_INPUT):
+        """
+        Advances the simulation by one tick, without drawing anything
+
+        :param inputs: FrameInput with the keys held (left, right) and pressed (jump, dash) this tick
+        """
+        self.movement = [inputs.left, inputs.right]
+        if inputs.jump:
+            if self.player.jump():
+                self.sfx['jump'].play()
+        if inputs.dash:
+            self.player.dash()
+
+        self.tick += 1
+        self.won = False
+
+        self.screen_shake = max(0, self.screen_shake - 1)
+
+        if not len(self.enemies):
+            self.transition += 1
+            # le niveau suivant est lu pendant l'animation de transition
+            self.levels.preload(self.levels.next_level(self.level))
+            if self.transition > 30:
+                self.level = self.levels.next_level(self.level)
+                self.load_level(self.level)
+            elif self.level == self.levels.last_level:
+                self.won = True
+
+        if self.transition < 0:
+            self.transition += 1
+
+
+        if self.dead:
+            self.dead += 1
+            if self.dead >= 10:
+                self.transition = min(self.transition + 1, 30)
+            self.screen_shake = max(16, self.screen_shake)
+            if self.dead > 40:
+                self.load_level(self.level)
+
+
+
+        self.scroll[0] += (self.player.rect().centerx  - self.display.get_width() / 2 - self.scroll[0]) / 10
+
+        self.scroll[1] += (self.player.rect().centery  - self.display.get_height() / 2 - self.scroll[1]) / 10
+
+        with self.profiler.phase('leaves'):
+            player_rect = self.player.rect()
+            # ajout des feuilles des arbres
+            touched = self.broadphase.query('trees', player_rect)
+            for i, rect in enumerate(self.leaf_spawners_trees):
+                if self.rng.random() * 49999 < rect.width * rect.height:
+                    pos = (rect.x + self.rng.random()*rect.width, rect.y + self.rng.random()*rect.height)
 
-    def run(self):
-        pygame.mixer.music.load('data/music.wav')
-        pygame.mixer.music.set_volume(0.5)
-        pygame.mixer.music.play(-1)
+                    self.particles.spawn('leaf', pos, velocity = [self.rng.randint(-1, 1), self.rng.randint(-2, 6)*0.1], frame = self.rng.randint(0, 20))
 
-        self.sfx['ambience'].play(-1)
-        while True:
-            self.display.fill((0, 0, 0, 0))
-            self.display_2.blit(self.assets['background'], (0, 0))
-
-            self.screen_shake = max(0, self.screen_shake - 1)
-
-            if not len(self.enemies):
-                self.transition += 1
-                if self.transition > 30:
-                    self.level = min(len(os.listdir('data/maps')) -1 , self.level + 1)
-                    self.load_level(self.level)
-                elif self.level == len(os.listdir('data/maps')) -1:
-                    self.display.fill((0, 0, 0))
-                    self.display_2.blit(self.assets['background'], (0, 0))
-                    font = pygame.font.Font(None, 50)
-                    text = font.render('You win !', True, (255, 255, 255))
-                    text_rect = text.get_rect(center=(self.display.get_width()//2, self.display.get_height()//2))
-                    self.display.blit(text, text_rect)
-                    self.display_2.blit(self.display, (0,0))
-                    
-            if self.transition < 0:
-                self.transition += 1
-
-            
-            if self.dead:
-                self.dead += 1
-                if self.dead >= 10:
-                    self.transition = min(self.transition + 1, 30)
-                self.screen_shake = max(16, self.screen_shake)
-                if self.dead > 40:
-                    self.load_level(self.level)
-
-            
-
-            self.scroll[0] += (self.player.rect().centerx  - self.display.get_width() / 2 - self.scroll[0]) / 10
-
-            self.scroll[1] += (self.player.rect().centery  - self.display.get_height() / 2 - self.scroll[1]) / 10
-
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+                if i in touched:
+                    if self.rng.randint(0,10) < 3:
+                        self.particles.spawn('leaf', (rect.x + self.rng.randint(0, rect.width), rect.y + self.rng.randint(0, rect.height)), velocity = [self.rng.randint(-1, 1), self.rng.randint(-2, 6)*0.1],frame = self.rng.randint(0, 20))
 
-            # ajout des feuilles des arbres
-            for rect in self.leaf_spawners_trees:
-                if random.random() * 49999 < rect.width * rect.height:
-                    pos = (rect.x + random.random()*rect.width, rect.y + random.random()*rect.height)
-
-                    self.particles.append(Particle(self, 'leaf', pos, velocity = [random.randint(-1, 1), random.randint(-2, 6)*0.1], frame = random.randint(0, 20)))
-                
-                if self.player.rect().colliderect(rect):
-                    if random.randint(0,10) < 3:
-                        self.particles.append(Particle(self, 'leaf', (rect.x + random.randint(0, rect.width), rect.y + random.randint(0, rect.height)), velocity = [random.randint(-1, 1), random.randint(-2, 6)*0.1],frame = random.randint(0, 20)))
-
-
-            # ajout des feuilles des buissons
-            for rect in self.leaf_spawners_bushes:
-                if self.player.rect().colliderect(rect) and (self.player.last_movement[0] != 0 or self.player.velocity[0] != 0):
-                    if random.randint(0,10) < 1:
-                        self.particles.append(Particle(self, 'leaf', (rect.x + random.randint(0, rect.width), rect.y + random.randint(0, rect.height)), velocity = [random.randint(-1, 1), random.randint(-2, 6)*0.1],frame = random.randint(0, 20)))
-                
-                if self.player.rect().colliderect(rect) and (self.player.velocity[1] > 0.1 or self.player.velocity[1] < -0.1):
-                    if random.randint(0,10) < self.player.velocity[1] * 2:
+
+            # ajout des feuilles des buissons, seulement ceux que le joueur touche
+            for i in sorted(self.broadphase.query('bushes', player_rect)):
+                rect = self.leaf_spawners_bushes[i]
+                if self.player.last_movement[0] != 0 or self.player.velocity[0] != 0:
+                    if self.rng.randint(0,10) < 1:
+                        self.particles.spawn('leaf', (rect.x + self.rng.randint(0, rect.width), rect.y + self.rng.randint(0, rect.height)), velocity = [self.rng.randint(-1, 1), self.rng.randint(-2, 6)*0.1],frame = self.rng.randint(0, 20))
+
+                if self.player.velocity[1] > 0.1 or self.player.velocity[1] < -0.1:
+                    if self.rng.randint(0,10) < self.player.velocity[1] * 2:
                         for _ in range(round(self.player.velocity[1] * 3)):
-                            self.particles.append(Particle(self, 'leaf', (rect.x + random.randint(0, rect.width), rect.y + random.randint(0, rect.height)), velocity = [random.randint(-1, 1), random.randint(-2, 6)*0.1],frame = random.randint(0, 20)))
-                    
-            self.clouds.update()
-            self.clouds.render(self.display_2, offset = render_scroll)
+                            self.particles.spawn('leaf', (rect.x + self.rng.randint(0, rect.width), rect.y + self.rng.randint(0, rect.height)), velocity = [self.rng.randint(-1, 1), self.rng.randint(-2, 6)*0.1],frame = self.rng.randint(0, 20))
 
-            self.tilemap.render(self.display, offset = render_scroll)
+        with self.profiler.phase('background'):
+            self.background.update()
 
+        with self.profiler.phase('enemies'):
+            if abs(self.player.dashing) >= self.tuning.dash_end:
+                # un ennemi bouge de moins de DASH_MARGIN pixels par tick
+                self.dash_targets = self.broadphase.query('enemies', self.player.rect().inflate(DASH_MARGIN * 2, DASH_MARGIN * 2))
+            else:
+                self.dash_targets = set()
+            if self.lod_radius is None:
+                active = None
+            else:
+                view = self.view_rect().inflate(self.lod_radius * 2, self.lod_radius * 2)
+                active = self.broadphase.query('enemies', view)
+            self.active_enemies = len(self.enemies) if active is None else len(active)
             for enemy in self.enemies.copy():
+                if active is not None and enemy not in active:
+                    # les ennemis loin de l'ecran sont mis a jour a tour de role
+                    if (self.tick + enemy.lod_phase) % LOD_INTERVAL == 0:
+                        enemy.coarse_update(LOD_INTERVAL)
+                    continue
                 kill = enemy.update(self.tilemap, movement = (0,0))
-                enemy.render(self.display, offset = render_scroll)
                 if kill:
                     self.enemies.remove(enemy)
-                    
+                    self.enemy_pool.append(enemy)
+                    self.broadphase.remove('enemies', enemy)
+                else:
+                    self.broadphase.move('enemies', enemy, enemy.rect())
+
 
+        with self.profiler.phase('player'):
             if not self.dead:
                 self.player.update(self.tilemap,(self.movement[1] - self.movement[0], 0))
-                self.player.render(self.display, offset = render_scroll)  
-
-            # [[x,y], direction, timer]
-            for projectile in self.projectiles.copy():
-                projectile[0][0] += projectile[1]
-                projectile[2] += 1
-                img = self.assets['projectile']
-                self.display.blit(img, (projectile[0][0] - render_scroll[0] - img.get_width()/2, projectile[0][1] - render_scroll[1] - img.get_height()/2))
-                if self.tilemap.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile)
+
+        with self.profiler.phase('projectiles'):
+            # le joueur ne peut pas etre touche pendant un dash
+            target = self.player.rect() if abs(self.player.dashing) < self.tuning.dash_end else None
+            for x, y, vx, vy, hit in self.projectiles.update(self.tilemap, target):
+                if not hit:
                     for _ in range(4):
-                        self.sparks.append(Spark(projectile[0], random.random() - 0.5 +(+ math.pi if projectile[1] > 0 else 0), 2 + random.random()))
-                elif projectile[2] > 360:
-                    self.projectiles.remove(projectile)
-                elif abs(self.player.dashing) < 50:
-                    if self.player.rect().collidepoint(projectile[0]):
-                        self.sfx['hit'].play()
-                        self.projectiles.remove(projectile)
-                        self.dead += 1
-                        self.screen_shake = max(16, self.screen_shake)
-                        for _ in range(30):
-                            angle = random.random() * math.pi * 2
-                            speed = random.random()*5
-                            self.sparks.append(Spark(self.player.rect().center, angle, random.random() + 2))  
-                            self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity = [math.cos(angle + math.pi ) *speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame = random.randint(0, 7)))
-
-            
-            for spark in self.sparks.copy():
-                kill = spark.update()
-                spark.render(self.display, offset = render_scroll)
-                if kill:
-                    self.sparks.remove(spark)
-
-            display_mask = pygame.mask.from_surface(self.display)
-            display_sillhouette = display_mask.to_surface(setcolor=(0,0,0,180), unsetcolor=(0,0,0,0))
-            for offset in [(1,0), (-1,0), (0,1), (0,-1)]:
-                self.display_2.blit(display_sillhouette, offset)
-
-            for particle in self.particles.copy():
-                kill = particle.update()
-                particle.render(self.display, offset = render_scroll)
-                if particle.type == 'leaf':
-                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
-                if kill:
-                    self.particles.remove(particle)
-            
+                        self.sparks.spawn((x, y), self.rng.random() - 0.5 +(+ math.pi if vx > 0 else 0), 2 + self.rng.random())
+                else:
+                    self.sfx['hit'].play()
+                    self.dead += 1
+                    self.screen_shake = max(16, self.screen_shake)
+                    for _ in range(30):
+                        angle = self.rng.random() * math.pi * 2
+                        speed = self.rng.random()*5
+                        self.sparks.spawn(self.player.rect().center, angle, self.rng.random() + 2)
+                        self.particles.spawn('particle', self.player.rect().center, velocity = [math.cos(angle + math.pi ) *speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame = self.rng.randint(0, 7))
+
+        with self.profiler.phase('sparks'):
+            self.sparks.update()
+
+        with self.profiler.phase('particles'):
+            self.particles.update()
+
+        if self.history is not None:
+            self.history.push(self.snapshot())
+
+    def render(self):
+        """
+        Draws the current state of the game on display_2
+        """
+        self.display.fill((0, 0, 0, 0))
+
+        render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+
+        with self.profiler.phase('background'):
+            self.background.render(self.display_2, offset = render_scroll)
+
+        if self.won:
+            self.display.fill((0, 0, 0))
+            if self.win_text is None:
+                self.win_text = pygame.font.Font(None, 50).render('You win !', True, (255, 255, 255))
+            text_rect = self.win_text.get_rect(center=(self.display.get_width()//2, self.display.get_height()//2))
+            self.display.blit(self.win_text, text_rect)
+            self.display_2.blit(self.display, (0,0))
+
+        with self.profiler.phase('tilemap'):
+            self.tilemap.render(self.display, offset = render_scroll)
+
+        with self.profiler.phase('enemies'):
+            visible = self.broadphase.query('enemies', self.view_rect().inflate(RENDER_MARGIN * 2, RENDER_MARGIN * 2))
+            for enemy in self.enemies:
+                if enemy in visible:
+                    enemy.render(self.display, offset = render_scroll)
+
+        with self.profiler.phase('player'):
+            if not self.dead:
+                self.player.render(self.display, offset = render_scroll)
+
+        with self.profiler.phase('projectiles'):
+            self.projectiles.render(self.display, offset = render_scroll)
+
+        with self.profiler.phase('sparks'):
+            self.sparks.render(self.display, offset = render_scroll)
+
+        with self.profiler.phase('outline'):
+            self.outline.update(self.display)
+            self.outline.render(self.display_2)
+
+        with self.profiler.phase('particles'):
+            self.particles.render(self.display, offset = render_scroll)
+
+        with self.profiler.phase('present'):
+            if self.transition:
+                self.display.blit(self.transition_mask((30 - abs(self.transition)) * self.transition_step), (0,0))
+
+            self.display_2.blit(self.display, (0,0))
+
+    def transition_mask(self, radius):
+        """
+        Returns the black surface with a transparent circle of the given radius drawn
+        over the display during the transitions, built once per radius
+        """
+        mask = self.transition_masks.get(radius)
+        if mask is None:
+            mask = pygame.Surface(self.display.get_size())
+            pygame.draw.circle(mask, (255,255,255), (self.display.get_width()//2, self.display.get_height()//2), radius, 0)
+            mask.set_colorkey((255,255,255), pygame.RLEACCEL)
+            self.transition_masks[radius] = mask
+        return mask
+
+    def checksum(self):
+        """
+        Returns a crc32 of the simulation state, used to detect desyncs between runs
+        """
+        projectiles = self.projectiles
+        state = (self.tick, self.level, self.dead, self.transition, self.player.pos, self.player.velocity, self.player.dashing,
+                 [(enemy.pos, enemy.walking, enemy.flip) for enemy in self.enemies],
+                 projectiles.pos[:projectiles.count].tolist(), projectiles.timer[:projectiles.count].tolist(), len(self.particles), len(self.sparks))
+        return zlib.crc32(repr(state).encode())
+
+    def present(self):
+        with self.profiler.phase('present'):
+            # le tremblement est exprime en pixels de la fenetre (2 par pixel du display a l'origine)
+            shake = self.screen_shake * self.scale / OUTPUT_SCALE
+            screenshake_offset = (random.random()*shake - shake/2, random.random()*shake*2 - shake)
+            if self.scale_buffer is None:
+                self.screen.blit(self.display_2, screenshake_offset)
+            else:
+                pygame.transform.scale(self.display_2, self.scale_buffer.get_size(), self.scale_buffer)
+                self.screen.blit(self.scale_buffer, screenshake_offset)
+        self.profiler.render(self.screen)
+        pygame.display.update()
+
+    def simulate(self, inputs=None, ticks=None, render=False):
+        """
+        Runs the game as fast as possible, without waiting for the clock or reading events
+
+        :param inputs: iterable of FrameInput, one per tick (no input if None)
+        :param ticks: max number of ticks to run (until inputs are exhausted if None)
+        :param render: also draw each frame off-screen
+
+        return : number of ticks run
+        """
+        if inputs is None:
+            inputs = itertools.repeat(NO_INPUT)
+        if ticks is not None:
+            inputs = itertools.islice(inputs, ticks)
+        count = 0
+        for frame_input in inputs:
+            self.profiler.begin_frame()
+            self.step(frame_input)
+            if render:
+                self.render()
+            self.end_profiler_frame()
+            count += 1
+        return count
+
+    def end_profiler_frame(self):
+        self.profiler.end_frame(enemies=len(self.enemies), active_enemies=self.active_enemies, projectiles=len(self.projectiles), particles=len(self.particles), sparks=len(self.sparks))
+
+    def run(self, record_path=None, profile_path=None):
+        """
+        Main loop of the game, at 60 FPS
+
+        :param record_path: if given, the inputs are recorded and saved there when the game is closed
+        :param profile_path: if given, the frame timings are exported there (.json or .csv) when the game is closed
+        """
+        if profile_path:
+            # toute la partie est exportee, pas seulement les dernieres frames
+            self.profiler = FrameProfiler(enabled=True, history=None, overlay=self.profiler.overlay)
+
+        recorder = InputRecorder(self) if record_path else None
+
+        pygame.mixer.music.load('data/music.wav')
+        pygame.mixer.music.set_volume(0.5)
+        pygame.mixer.music.play(-1)
+
+        self.sfx['ambience'].play(-1)
+        while True:
+            self.profiler.begin_frame()
+            jump = False
+            dash = False
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    if recorder:
+                        recorder.save(record_path)
+                    if profile_path:
+                        self.profiler.export(profile_path)
                     pygame.quit()
                     sys.exit()
                 if event.type == pygame.KEYDOWN:
@@ -248,27 +541,56 @@ class Game:
                     if event.key == pygame.K_d:
                         self.movement[1] = True
                     if event.key == pygame.K_SPACE:
-                        if self.player.jump():
-                            self.sfx['jump'].play()
+                        jump = True
                     if event.key == pygame.K_z:
-                        self.player.dash()
+                        dash = True
+                    if event.key == pygame.K_F3:
+                        self.profiler.toggle_overlay()
                 if event.type == pygame.KEYUP:
                     if event.key == pygame.K_q:
                         self.movement[0] = False
                     if event.key == pygame.K_d:
                         self.movement[1] = False
 
-            if self.transition:
-                transition_surf = pygame.Surface(self.display.get_size())
-                pygame.draw.circle(transition_surf, (255,255,255), (self.display.get_width()//2, self.display.get_height()//2), (30 - abs(self.transition))*8, 0)
-                transition_surf.set_colorkey((255,255,255))
-                self.display.blit(transition_surf, (0,0))
-            
-            self.display_2.blit(self.display, (0,0))
-
-            screenshake_offset = (random.random()*self.screen_shake - self.screen_shake/2, random.random()*self.screen_shake*2 - self.screen_shake)
-            self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()), screenshake_offset)
-            pygame.display.update()
+            # retour en arriere tant que retour est enfonce (pas pendant un enregistrement)
+            if self.history is not None and not recorder and pygame.key.get_pressed()[pygame.K_BACKSPACE]:
+                self.rewind()
+            else:
+                frame_input = FrameInput(self.movement[0], self.movement[1], jump, dash)
+                self.step(frame_input)
+                if recorder:
+                    recorder.record(frame_input)
+            self.render()
+            self.present()
+            self.end_profiler_frame()
             self.clock.tick(60)
- 
-Game().run()
\ No newline at end of file
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ninja game')
+    parser.add_argument('--seed', type=int, help='seed of the game RNG')
+    parser.add_argument('--level', type=int, default=0, help='first level')
+    parser.add_argument('--record', metavar='PATH', help='record the inputs of the game in a replay file')
+    parser.add_argument('--replay', metavar='PATH', help='play a replay file headless, as fast as possible')
+    parser.add_argument('--rewind', type=float, default=0, metavar='SECONDS', help='keep the last SECONDS of the game, played backwards while backspace is held')
+    parser.add_argument('--resolution', type=lambda s: tuple(int(v) for v in s.split('x')), default=RESOLUTION, metavar='WxH', help='internal resolution of the game')
+    parser.add_argument('--scale', type=int, default=OUTPUT_SCALE, help='size of a game pixel in the window')
+    parser.add_argument('--scaled', action='store_true', help='let SDL scale the game to the window (resizable, integer scaling)')
+    parser.add_argument('--profile', metavar='PATH', help='export the frame timings (.json or .csv) when the game is closed or the replay is over')
+    args = parser.parse_args()
+
+    if args.replay:
+        recording = Recording.load(args.replay)
+        game = Game(headless=True, seed=recording.seed, level=recording.level, resolution=recording.resolution)
+        game.profiler = FrameProfiler(enabled=bool(args.profile), history=len(recording))
+        start = time.perf_counter()
+        desync = replay(game, recording)
+        duration = time.perf_counter() - start
+        if args.profile:
+            game.profiler.export(args.profile)
+        print(f'{len(recording)} ticks in {duration:.2f}s ({len(recording) / max(duration, 1e-9):.0f} ticks/s), level {game.level}')
+        if desync is not None:
+            print(f'desync at tick {desync}')
+            sys.exit(1)
+    else:
+        Game(seed=args.seed, level=args.level, history=int(args.rewind * 60), resolution=args.resolution, scale=args.scale, scaled=args.scaled).run(record_path=args.record, profile_path=args.profile)
@@ -0,0 +1,230 @@
+import hashlib
+import math
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame
+
+from scripts.utils import BASE_IMG_PATH, Animation
+
+CACHE_DIR = 'data/cache'
+
+# en-tete d'un atlas en cache : magic, version, signature des fichiers sources, taille de l'atlas, nombre d'images
+ATLAS_HEADER = struct.Struct('<4sH20sHHH')
+ATLAS_MAGIC = b'NJAT'
+ATLAS_VERSION = 1
+ATLAS_RECT = struct.Struct('<4H')
+
+COLORKEY = (0, 0, 0)
+
+# name -> file or directory of images, relative to BASE_IMG_PATH
+IMAGES = {
+    'grass' : 'tiles/grass',
+    'stone' : 'tiles/stone',
+    'decor' : 'tiles/decor',
+    'large_decor' : 'tiles/large_decor',
+    'spawners' : 'tiles/spawners',
+    'player' : 'entities/player.png',
+    'background' : 'background.png',
+    'clouds' : 'clouds',
+    'gun' : 'gun.png',
+    'projectile' : 'projectile.png',
+}
+
+# name -> (directory of frames, img_dur, loop)
+ANIMATIONS = {
+    'enemy/idle' : ('entities/enemy/idle', 6, True),
+    'enemy/run' : ('entities/enemy/run', 4, True),
+    'player/idle' : ('entities/player/idle', 6, True),
+    'player/run' : ('entities/player/run', 4, True),
+    'player/jump' : ('entities/player/jump', 5, True),
+    'player/slide' : ('entities/player/slide', 5, True),
+    'player/wallslide' : ('entities/player/wall_slide', 5, True),
+    'particles/leaf' : ('particles/leaf', 20, False),
+    'particles/particle' : ('particles/particle', 6, False),
+}
+
+TILE_ASSETS = ['grass', 'stone', 'decor', 'large_decor']
+GAME_ASSETS = TILE_ASSETS + ['player', 'background', 'clouds', 'gun', 'projectile'] + list(ANIMATIONS)
+EDITOR_ASSETS = TILE_ASSETS + ['spawners']
+
+
+def _decode(path):
+    """
+    Decodes a PNG into RGB bytes, the alpha channel is dropped like with convert()
+    (runs in the worker threads: pygame.image.load releases the GIL while decoding)
+    """
+    img = pygame.image.load(path)
+    return img.get_size(), pygame.image.tobytes(img, 'RGB')
+
+
+def pack(sizes):
+    """
+    Places rectangles on shelves, the tallest first
+
+    :param sizes: list of (w, h)
+    return : size of the atlas and the (x, y, w, h) of each rectangle, in the order of sizes
+    """
+    if not sizes:
+        return (0, 0), []
+    area = sum(w * h for w, h in sizes)
+    width = max(max(w for w, h in sizes), math.ceil(math.sqrt(area)))
+    rects = [None] * len(sizes)
+    x = y = shelf_h = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[i]
+        if x + w > width:
+            x = 0
+            y += shelf_h
+            shelf_h = 0
+        rects[i] = (x, y, w, h)
+        x += w
+        shelf_h = max(shelf_h, h)
+    return (width, y + shelf_h), rects
+
+
+class AssetLoader:
+    """
+    Loads the images of the game, each category (a directory of images or a single
+    file) packed in one atlas surface. The decoded atlases are cached on disk and
+    reused as long as the source files keep the same names, sizes and mtimes, so a
+    warm start reads raw pixels instead of decoding PNGs.
+    """
+
+    def __init__(self, base_path=BASE_IMG_PATH, cache_dir=CACHE_DIR, workers=None):
+        """
+        :param base_path: directory of the images
+        :param cache_dir: directory of the cached atlases (None disables the cache)
+        :param workers: number of decoding threads (default: ThreadPoolExecutor default)
+        """
+        self.base_path = base_path
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.atlases = {}
+
+    def files(self, path):
+        full = self.base_path + path
+        if os.path.isdir(full):
+            return [full + '/' + name for name in sorted(os.listdir(full))]
+        return [full]
+
+    def signature(self, files):
+        digest = hashlib.sha1()
+        for path in files:
+            stat = os.stat(path)
+            digest.update(('%s;%d;%d\n' % (os.path.basename(path), stat.st_size, stat.st_mtime_ns)).encode())
+        return digest.digest()
+
+    def cache_path(self, path):
+        return os.path.join(self.cache_dir, path.replace('/', '_') + '.atlas')
+
+    def read_cache(self, path, signature):
+        """
+        return : (atlas size, rects, RGB bytes) or None if the cache is missing or stale
+        """
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.cache_path(path), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < ATLAS_HEADER.size:
+            return None
+        magic, version, cached_signature, w, h, count = ATLAS_HEADER.unpack_from(data)
+        if magic != ATLAS_MAGIC or version != ATLAS_VERSION or cached_signature != signature:
+            return None
+        offset = ATLAS_HEADER.size
+        rects = [ATLAS_RECT.unpack_from(data, offset + i * ATLAS_RECT.size) for i in range(count)]
+        offset += count * ATLAS_RECT.size
+        pixels = data[offset:]
+        if len(pixels) != w * h * 3:
+            return None
+        return (w, h), rects, pixels
+
+    def write_cache(self, path, signature, size, rects, pixels):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target = self.cache_path(path)
+        tmp = target + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(ATLAS_HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, signature, size[0], size[1], len(rects)))
+                for rect in rects:
+                    f.write(ATLAS_RECT.pack(*rect))
+                f.write(pixels)
+            os.replace(tmp, target)
+        except OSError:
+            # le cache n'est qu'une optimisation
+            pass
+
+    def build(self, decoded):
+        """
+        Packs decoded images into the pixels of one atlas
+
+        :param decoded: list of (size, RGB bytes)
+        """
+        size, rects = pack([img_size for img_size, _ in decoded])
+        atlas = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        for (x, y, w, h), (_, pixels) in zip(rects, decoded):
+            atlas[y:y + h, x:x + w] = np.frombuffer(pixels, dtype=np.uint8).reshape(h, w, 3)
+        return size, rects, atlas.tobytes()
+
+    def load(self, paths):
+        """
+        Loads categories of images
+
+        :param paths: list of files or directories, relative to base_path
+        return : dict path -> list of surfaces (subsurfaces of the atlas of the category)
+        """
+        pending = {}
+        atlases = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for path in dict.fromkeys(paths):
+                if path in self.atlases:
+                    continue
+                files = self.files(path)
+                signature = self.signature(files)
+                cached = self.read_cache(path, signature)
+                if cached is not None:
+                    atlases[path] = cached
+                else:
+                    pending[path] = (signature, [pool.submit(_decode, file) for file in files])
+
+            for path, (signature, futures) in pending.items():
+                size, rects, pixels = self.build([future.result() for future in futures])
+                self.write_cache(path, signature, size, rects, pixels)
+                atlases[path] = (size, rects, pixels)
+
+        for path, (size, rects, pixels) in atlases.items():
+            atlas = pygame.image.frombytes(pixels, size, 'RGB').convert()
+            atlas.set_colorkey(COLORKEY)
+            self.atlases[path] = (atlas, [atlas.subsurface(rect) for rect in rects])
+
+        return {path: self.atlases[path][1] for path in paths}
+
+    def load_assets(self, names):
+        """
+        Builds the asset dict of the game or the editor
+
+        :param names: names from IMAGES and ANIMATIONS, in the order of the returned dict
+        """
+        paths = [IMAGES[name] if name in IMAGES else ANIMATIONS[name][0] for name in names]
+        images = self.load(paths)
+        assets = {}
+        for name, path in zip(names, paths):
+            if name in ANIMATIONS:
+                _, img_dur, loop = ANIMATIONS[name]
+                assets[name] = Animation(images[path], img_dur=img_dur, loop=loop)
+            elif os.path.isdir(self.base_path + path):
+                assets[name] = images[path]
+            else:
+                assets[name] = images[path][0]
+        return assets
+
+
+def load_assets(names, cache_dir=CACHE_DIR):
+    return AssetLoader(cache_dir=cache_dir).load_assets(names)
@@ -1,8 +1,5 @@
 import pygame 
-from scripts.particles import Particle
-from scripts.spark import Spark
 import math
-import random
 
 class PhysicsEntity :
     """Classe de base pour les entités physiques du jeu"""
@@ -12,6 +9,7 @@ class PhysicsEntity :
         self.type = e_type
         self.pos = list(pos)
         self.size = size
+        self.hitbox = pygame.Rect(0, 0, size[0], size[1])
         self.velocity = [0, 0]
         self.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
 
@@ -25,18 +23,40 @@ class PhysicsEntity :
     def rect(self):
         """
         Retourne un objet pygame.Rect correspondant à la hitbox de l'entité
+
+        Le rect est mis a jour et reutilise a chaque appel : le copier pour le garder
         """
-        return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
+        self.hitbox.x = int(self.pos[0])
+        self.hitbox.y = int(self.pos[1])
+        return self.hitbox
     
     def set_action(self, action):
         if action != self.action:
             self.action = action
-            self.animation = self.game.assets[self.type + '/' + self.action].copy()
-            self.animation.frame = 0
+            self.animation = self.game.assets[self.type + '/' + self.action].player()
+
+    def get_state(self):
+        """
+        Returns the state of the entity as a tuple of immutable values
+        """
+        collisions = self.collisions
+        return (tuple(self.pos), tuple(self.velocity), self.flip, self.action, self.animation.frame, self.animation.done,
+                (collisions['up'], collisions['down'], collisions['left'], collisions['right']), tuple(self.last_movement))
+
+    def set_state(self, state):
+        pos, velocity, self.flip, action, frame, done, collisions, last_movement = state
+        self.pos[:] = pos
+        self.velocity[:] = velocity
+        self.set_action(action)
+        self.animation.frame = frame
+        self.animation.done = done
+        self.collisions['up'], self.collisions['down'], self.collisions['left'], self.collisions['right'] = collisions
+        self.last_movement = list(last_movement)
 
     def update(self, tilemap, movement = [0, 0]):
         # reset des collisions
-        self.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
+        collisions = self.collisions
+        collisions['up'] = collisions['down'] = collisions['left'] = collisions['right'] = False
 
         # calcul du deplacement
         frame_movement = (movement[0] + self.velocity[0], movement[1] + self.velocity[1])
@@ -92,15 +112,38 @@ class PhysicsEntity :
         self.animation.update()
 
     def render(self, surf, offset = (0, 0)):
-        surf.blit(pygame.transform.flip(self.animation.img(),self.flip,False), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+        surf.blit(self.animation.img(self.flip), (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
 
 
 
 class Enemy(PhysicsEntity):
-    def __init__(self, game, pos, size):
+    def __init__(self, game, pos, size, lod_phase=0):
+        """
+        :param lod_phase: tick offset of the coarse updates of the enemy when it is far from the camera,
+                          fixed at spawn so the kills do not shift the turns of the other enemies
+        """
         super().__init__(game, 'enemy', pos, size)
         self.set_action('idle')
         self.walking = 0
+        self.lod_phase = lod_phase
+
+    def get_state(self):
+        return (super().get_state(), self.walking, self.lod_phase)
+
+    def set_state(self, state):
+        super().set_state(state[0])
+        self.walking, self.lod_phase = state[1:]
+
+    def coarse_update(self, ticks):
+        """
+        Cheap update of an enemy far from the camera, standing for several ticks:
+        the walk timer runs but the enemy does not move, shoot or animate
+        """
+        tuning = self.game.tuning
+        if self.walking:
+            self.walking = max(0, self.walking - 2 * ticks)
+        elif self.game.rng.random() < 1 - (1 - tuning.walk_chance) ** ticks:
+            self.walking = self.game.rng.randint(tuning.walk_min, tuning.walk_max)
 
     def update(self, tilemap, movement = (0, 0)):
         if self.walking:
@@ -118,16 +161,18 @@ class Enemy(PhysicsEntity):
                 if (abs(dis[1]) < 16):
                     if (self.flip and dis[0] < 0):
                         self.game.sfx['shoot'].play()
-                        self.game.projectiles.append([[self.rect().centerx - 7, self.rect().centery], -1.5, 0])
+                        pos = (self.rect().centerx - 7, self.rect().centery)
+                        self.game.projectiles.spawn(pos, (-1, 0))
                         for _ in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random()))
+                            self.game.sparks.spawn(pos, self.game.rng.random() - 0.5 + math.pi, 2 + self.game.rng.random())
                     if (not self.flip and dis[0] > 0):
                         self.game.sfx['shoot'].play()
-                        self.game.projectiles.append([[self.rect().centerx + 7, self.rect().centery], 1.5, 0])
+                        pos = (self.rect().centerx + 7, self.rect().centery)
+                        self.game.projectiles.spawn(pos, (1, 0))
                         for _ in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5, 2 + random.random()))
-        elif random.random() < 0.01:
-            self.walking = random.randint(30, 120)
+                            self.game.sparks.spawn(pos, self.game.rng.random() - 0.5, 2 + self.game.rng.random())
+        elif self.game.rng.random() < self.game.tuning.walk_chance:
+            self.walking = self.game.rng.randint(self.game.tuning.walk_min, self.game.tuning.walk_max)
 
         super().update(tilemap, movement = movement)
 
@@ -136,24 +181,24 @@ class Enemy(PhysicsEntity):
         else:
             self.set_action('idle')
 
-        if abs(self.game.player.dashing) >= 50:
+        if self in self.game.dash_targets:
             if self.rect().colliderect(self.game.player.rect()):
                 self.game.sfx['hit'].play()
                 self.game.screen_shake = max(16, self.game.screen_shake)
                 for _ in range(30):
-                        angle = random.random() * math.pi * 2
-                        speed = random.random() * 5
-                        self.game.sparks.append(Spark(self.rect().center, angle, random.random() + 2))
-                        self.game.particles.append(Particle(self.game, 'particle', self.rect().center, velocity = [math.cos(angle + math.pi ) *speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame = random.randint(0, 7)))
-                self.game.sparks.append(Spark(self.rect().center,0, 5 + random.random()))
-                self.game.sparks.append(Spark(self.rect().center,math.pi, 5 + random.random()))
+                        angle = self.game.rng.random() * math.pi * 2
+                        speed = self.game.rng.random() * 5
+                        self.game.sparks.spawn(self.rect().center, angle, self.game.rng.random() + 2)
+                        self.game.particles.spawn('particle', self.rect().center, velocity = [math.cos(angle + math.pi ) *speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame = self.game.rng.randint(0, 7))
+                self.game.sparks.spawn(self.rect().center,0, 5 + self.game.rng.random())
+                self.game.sparks.spawn(self.rect().center,math.pi, 5 + self.game.rng.random())
                 return True
             
     def render(self, surf, offset = (0, 0)):
         super().render(surf, offset)
 
         if self.flip :
-            surf.blit(pygame.transform.flip(self.game.assets['gun'], True, False), (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0], self.rect().centery - offset[1]) )
+            surf.blit(self.game.assets['gun/flipped'], (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0], self.rect().centery - offset[1]) )
         else:
             surf.blit(self.game.assets['gun'], (self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1]) )
         
@@ -167,6 +212,14 @@ class Player(PhysicsEntity):
         super().__init__(game, 'player', pos, size)
         self.air_time = 0
         self.dashing = 0
+        self.wall_slide = False
+
+    def get_state(self):
+        return (super().get_state(), self.air_time, self.dashing, self.wall_slide)
+
+    def set_state(self, state):
+        super().set_state(state[0])
+        self.air_time, self.dashing, self.wall_slide = state[1:]
         
 
     
@@ -175,7 +228,7 @@ class Player(PhysicsEntity):
         
         self.air_time += 1
 
-        if self.air_time > 120 and self.game.tilemap.physics_rect_around(self.pos) == []:
+        if self.air_time > 120 and not self.game.tilemap.physics_rect_around(self.pos):
             self.game.dead += 1
 
         if self.collisions['down']:
@@ -201,22 +254,23 @@ class Player(PhysicsEntity):
             else:
                 self.set_action('idle')
         
-        if abs(self.dashing) in {60,50}:
+        tuning = self.game.tuning
+        if abs(self.dashing) in {tuning.dash_duration, tuning.dash_end}:
             for _ in range(20):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 0.5 + 0.5
+                angle = self.game.rng.random() * math.pi * 2
+                speed = self.game.rng.random() * 0.5 + 0.5
                 pvelocity = [math.cos(angle)*speed, math.sin(angle)*speed]
-                self.game.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame = random.randint(0, 7)))
+                self.game.particles.spawn('particle', self.rect().center, velocity=pvelocity, frame = self.game.rng.randint(0, 7))
         if self.dashing > 0:
             self.dashing = max(self.dashing - 1, 0)
         if self.dashing < 0:
             self.dashing = min(self.dashing + 1, 0)
-        if abs(self.dashing) > 50:
-            self.velocity[0] = abs(self.dashing) / self.dashing * 8
-            if abs(self.dashing) == 51:
+        if abs(self.dashing) > tuning.dash_end:
+            self.velocity[0] = abs(self.dashing) / self.dashing * tuning.dash_speed
+            if abs(self.dashing) == tuning.dash_end + 1:
                 self.velocity[0] *= 0.1
-            pvelocity = [abs(self.dashing) / self.dashing * random.random() *3, 0]
-            self.game.particles.append(Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame = random.randint(0, 7)))
+            pvelocity = [abs(self.dashing) / self.dashing * self.game.rng.random() *3, 0]
+            self.game.particles.spawn('particle', self.rect().center, velocity=pvelocity, frame = self.game.rng.randint(0, 7))
        
         if self.velocity[0] > 0:
             self.velocity[0] = max(self.velocity[0] - 0.1, 0)
@@ -242,9 +296,9 @@ class Player(PhysicsEntity):
     def dash(self) -> None:
         if not self.dashing:
             self.game.sfx['dash'].play()
-            self.dashing = -60 if self.flip else 60
+            self.dashing = -self.game.tuning.dash_duration if self.flip else self.game.tuning.dash_duration
 
     def render(self, surf, offset = (0,0)):
-        if abs(self.dashing) <= 50:
+        if abs(self.dashing) <= self.game.tuning.dash_end:
             super().render(surf, offset) 
         
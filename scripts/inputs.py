@@ -0,0 +1,6 @@
+from collections import namedtuple
+
+# etat des touches pour une frame : left/right sont maintenues, jump/dash viennent d'etre pressees
+FrameInput = namedtuple('FrameInput', ['left', 'right', 'jump', 'dash'], defaults=(False, False, False, False))
+
+NO_INPUT = FrameInput()
@@ -0,0 +1,122 @@
+"""
+Procedural stress levels: rows of autotiled grass and stone platforms over a
+stone floor, decor, trees and bushes (leaf spawners), the player spawner and
+any number of enemy spawners. The same arguments always give the same map.
+
+    python -m scripts.levelgen /tmp/stress.njm --width 10000 --height 1000 --enemies 5000
+    python game.py --level 9    (after writing data/maps/9.njm)
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from scripts.tilemap import Tilemap
+
+# index des types dans la grille generee (0 : case vide)
+TILE_TYPES = [None, 'grass', 'stone', 'decor']
+GRASS = 1
+STONE = 2
+DECOR = 3
+
+# taille des images large_decor par variante (0 : rocher, 1 : buisson, 2 : arbre)
+LARGE_DECOR_SIZES = [(31, 9), (25, 12), (33, 44)]
+# taille du joueur et des ennemis, leur position est celle du spawner
+ENTITY_SIZE = (8, 15)
+
+
+def generate(width, height, enemies, seed=0, spacing=8, trees=None, bushes=None, rocks=None, tile_size=16):
+    """
+    Generates a level
+
+    :param width: width of the map in tiles
+    :param height: height of the map in tiles
+    :param enemies: number of enemy spawners (variant 1)
+    :param seed: seed of the generation
+    :param spacing: rows between two rows of platforms
+    :param trees: number of trees (width // 25 if None), bushes (width // 20) and rocks (width // 40)
+
+    return : Tilemap of the level
+    """
+    rng = np.random.default_rng(seed)
+    trees = width // 25 if trees is None else trees
+    bushes = width // 20 if bushes is None else bushes
+    rocks = width // 40 if rocks is None else rocks
+
+    grid = np.zeros((height, width), dtype=np.uint8)
+    variants = np.zeros((height, width), dtype=np.uint8)
+
+    # sol de pierre sur toute la largeur
+    grid[height - 2:, :] = STONE
+    # rangees de plateformes, decalees verticalement au hasard
+    for row in range(spacing // 2, height - spacing, spacing):
+        x = int(rng.integers(0, 8))
+        while x < width:
+            length = int(rng.integers(4, 25))
+            thickness = int(rng.integers(1, 4))
+            y = min(max(row + int(rng.integers(-2, 3)), 1), height - 4)
+            grid[y:y + thickness, x:x + length] = GRASS if rng.random() < 0.75 else STONE
+            x += length + int(rng.integers(2, 8))
+
+    # cases libres au-dessus d'une case pleine : (ligne de la case libre, colonne)
+    top_y, top_x = np.nonzero((grid[:-1] == 0) & (grid[1:] != 0))
+
+    # petit decor pose sur l'herbe
+    grass_tops = (grid[1:] == GRASS)[top_y, top_x] & (rng.random(len(top_y)) < 0.05)
+    grid[top_y[grass_tops], top_x[grass_tops]] = DECOR
+    variants[top_y[grass_tops], top_x[grass_tops]] = rng.integers(0, 4, int(np.count_nonzero(grass_tops)))
+    free = ~grass_tops
+
+    tilemap = Tilemap(None, tile_size=tile_size)
+    tilemap.set_grid(grid, TILE_TYPES, variants=variants)
+    tilemap.autotile()
+
+    # les objets sont poses sur une case libre prise au hasard, le bas de l'image sur le sol
+    free_y = top_y[free]
+    free_x = top_x[free]
+
+    def ground(count):
+        cells = rng.integers(0, len(free_y), count)
+        return free_x[cells], free_y[cells] + 1
+
+    for variant, count in ((0, rocks), (1, bushes), (2, trees)):
+        w, h = LARGE_DECOR_SIZES[variant]
+        for x, y, dx in zip(*ground(count), rng.integers(0, tile_size, count)):
+            tilemap.add_offgrid({'type': 'large_decor', 'variant': variant, 'pos': [int(x) * tile_size + int(dx) - w // 2, int(y) * tile_size - h]})
+
+    # le joueur commence sur la case libre la plus a gauche
+    first = int(np.argmin(free_x * height + free_y))
+    tilemap.add_offgrid({'type': 'spawners', 'variant': 0, 'pos': [int(free_x[first]) * tile_size + 4, (int(free_y[first]) + 1) * tile_size - ENTITY_SIZE[1]]})
+    for x, y in zip(*ground(enemies)):
+        tilemap.add_offgrid({'type': 'spawners', 'variant': 1, 'pos': [int(x) * tile_size + 4, int(y) * tile_size - ENTITY_SIZE[1]]})
+    return tilemap
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Procedural stress level generator')
+    parser.add_argument('path', help='map to write (.njm recommended, .json for small maps)')
+    parser.add_argument('--width', type=int, default=10000, help='width in tiles')
+    parser.add_argument('--height', type=int, default=1000, help='height in tiles')
+    parser.add_argument('--enemies', type=int, default=5000, help='number of enemies')
+    parser.add_argument('--trees', type=int, help='number of trees (width / 25 by default)')
+    parser.add_argument('--bushes', type=int, help='number of bushes (width / 20 by default)')
+    parser.add_argument('--rocks', type=int, help='number of rocks (width / 40 by default)')
+    parser.add_argument('--spacing', type=int, default=8, help='rows between two rows of platforms')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generation')
+    args = parser.parse_args(argv)
+
+    if args.width < 8 or args.height < args.spacing + 4:
+        parser.error('the map is too small')
+    start = time.perf_counter()
+    tilemap = generate(args.width, args.height, args.enemies, seed=args.seed, spacing=args.spacing,
+                       trees=args.trees, bushes=args.bushes, rocks=args.rocks)
+    generated = time.perf_counter()
+    tilemap.save(args.path)
+    tiles = sum(chunk.count for chunk in tilemap.chunks.values())
+    print(f'{tiles} tiles in {len(tilemap.chunks)} chunks, {len(tilemap.offgrid)} off-grid tiles: '
+          f'generated in {generated - start:.2f}s, saved in {time.perf_counter() - generated:.2f}s')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from scripts.tilemap import Tilemap
+from scripts.spatial import SpatialHash
+from scripts.mapformat import EXTENSION
+
+MAPS_PATH = 'data/maps'
+
+MAP_NAME = re.compile(r'^(\d+)(\.json|' + re.escape(EXTENSION) + ')$')
+
+
+def map_paths(path=MAPS_PATH):
+    """
+    Returns a dict of level id -> path of the map of the level in a folder
+    """
+    paths = {}
+    for name in os.listdir(path):
+        match = MAP_NAME.match(name)
+        # si les deux formats existent, le binaire est prefere
+        if match and (int(match.group(1)) not in paths or match.group(2) == EXTENSION):
+            paths[int(match.group(1))] = os.path.join(path, name)
+    return paths
+
+
+class Level:
+    """
+    Pristine state of a level, parsed once and shared by every (re)start of the level
+    """
+    __slots__ = ('level_id', 'tilemap', 'spawners', 'trees', 'bushes', 'tree_index', 'bush_index')
+
+    def __init__(self, level_id, tilemap, spawners, trees, bushes):
+        """
+        :param tilemap: Tilemap of the level without its spawners, never modified by the game
+        :param spawners: list of (variant, pos) of the spawners, in map order
+        :param trees: (x, y, w, h) of the leaf spawners of the trees
+        :param bushes: (x, y, w, h) of the leaf spawners of the bushes
+        """
+        self.level_id = level_id
+        self.tilemap = tilemap
+        self.spawners = spawners
+        self.trees = trees
+        self.bushes = bushes
+        # index des rects des arbres et des buissons par leur position dans trees et bushes
+        self.tree_index = SpatialHash()
+        for i, rect in enumerate(trees):
+            self.tree_index.insert(i, rect)
+        self.bush_index = SpatialHash()
+        for i, rect in enumerate(bushes):
+            self.bush_index.insert(i, rect)
+
+
+class LevelManager:
+    """
+    Indexes the maps of MAPS_PATH once and keeps every parsed level in memory, so
+    that restarting or changing level does not touch the disk. The next level can
+    be parsed in a background thread with preload().
+    """
+
+    def __init__(self, game, path=MAPS_PATH):
+        self.game = game
+        self.paths = map_paths(path)
+        self.ids = sorted(self.paths)
+        self.levels = {}
+        self.pending = {}
+        self.executor = None
+
+    @property
+    def last_level(self):
+        return self.ids[-1] if self.ids else 0
+
+    def next_level(self, level_id):
+        """
+        Returns the id of the level after level_id (level_id itself for the last one)
+        """
+        for next_id in self.ids:
+            if next_id > level_id:
+                return next_id
+        return level_id
+
+    def parse(self, level_id):
+        tilemap = Tilemap(self.game, tile_size=16)
+        try:
+            tilemap.load(self.paths[level_id])
+        except KeyError:
+            print("Map not found !")
+        # pygame.Rect arrondit les positions a l'entier inferieur, l'index doit utiliser les memes valeurs
+        trees = [tuple(pygame.Rect(tree['pos'][0] + 4, tree['pos'][1] + 4, 23, 13)) for tree in tilemap.extract([('large_decor', 2)], keep=True)]
+        bushes = [tuple(pygame.Rect(bush['pos'][0] + 3, bush['pos'][1] + 3, 19, 9)) for bush in tilemap.extract([('large_decor', 1)], keep=True)]
+        spawners = [(spawner['variant'], tuple(spawner['pos'])) for spawner in tilemap.extract([('spawners', 0), ('spawners', 1)], keep=False)]
+        return Level(level_id, tilemap, spawners, trees, bushes)
+
+    def preload(self, level_id):
+        """
+        Starts parsing a level in a background thread, if it is not loaded yet
+        """
+        if level_id in self.levels or level_id in self.pending:
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending[level_id] = self.executor.submit(self.parse, level_id)
+
+    def get(self, level_id):
+        """
+        Returns a Level, parsed on first use (or waiting for its preload)
+        """
+        level = self.levels.get(level_id)
+        if level is None:
+            future = self.pending.pop(level_id, None)
+            level = future.result() if future is not None else self.parse(level_id)
+            self.levels[level_id] = level
+        return level
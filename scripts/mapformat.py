@@ -0,0 +1,225 @@
+"""
+Binary map format (.njm)
+
+    header | type names | chunk records | off-grid records | chunk index
+
+Each chunk record holds the CHUNK_AREA type ids then the CHUNK_AREA variants of
+a chunk (zlib compressed if FLAG_ZLIB is set), type ids being indexes in the
+type names of the file. The off-grid tiles are stored with the chunk containing
+their position. The index, at the end of the file, gives the position of the
+records of each chunk, so a chunk can be read from the memory-mapped file
+without decoding the rest of the map.
+
+Converter:
+
+    python -m scripts.mapformat data/maps/0.json data/maps/0.njm
+    python -m scripts.mapformat data/maps/0.njm data/maps/0.json
+"""
+import io
+import mmap
+import os
+import struct
+import sys
+import zlib
+from collections import namedtuple
+
+EXTENSION = '.njm'
+
+# magic, version, flags, tile_size, nombre de types, nombre de chunks, position de l'index
+HEADER = struct.Struct('<4sHHHHIQ')
+MAGIC = b'NJMP'
+VERSION = 1
+FLAG_ZLIB = 1
+
+# cx, cy, position et taille du record de la grille, nombre de cases pleines, position et nombre de tuiles hors grille
+INDEX_ENTRY = struct.Struct('<iiQIHQI')
+# ordre d'ajout, type, variante, position en pixels
+OFFGRID_RECORD = struct.Struct('<IHHdd')
+
+NAME_LENGTH = struct.Struct('<B')
+
+
+# copie d'une Tilemap prise par capture_map, ecrite ensuite par write_capture (eventuellement dans un autre thread)
+# chunks : liste de (cle, nombre de cases pleines, revision, types + variantes, record deja encode)
+MapCapture = namedtuple('MapCapture', ['tile_size', 'chunk_px', 'tile_types', 'chunks', 'offgrid', 'compress'])
+
+
+def capture_map(tilemap, compress=True, use_records=False):
+    """
+    Copies the content of a Tilemap, to call on the thread that edits it. The copy
+    can then be written by write_capture while the map is modified.
+
+    :param use_records: take the encoded record of the chunks unchanged since they were
+                        last written (Tilemap.records) instead of copying them
+    """
+    # seuls les chunks autour de la camera sont en memoire, le reste de la carte serait perdu
+    if tilemap.stream_file is not None:
+        raise ValueError('streamed maps are read-only')
+    offgrid = []
+    for tile in tilemap.offgrid.values():
+        tilemap.type_id(tile['type'])
+        offgrid.append({'type': tile['type'], 'variant': tile['variant'], 'pos': list(tile['pos'])})
+    chunks = []
+    for key, chunk in tilemap.chunks.items():
+        revision = tilemap.chunk_revision(key)
+        record = tilemap.records.get(key) if use_records else None
+        if record is not None and record[0] == revision and record[1] == compress:
+            chunks.append((key, chunk.count, revision, None, record[2]))
+        else:
+            chunks.append((key, chunk.count, revision, bytes(chunk.types) + bytes(chunk.variants), None))
+    return MapCapture(tilemap.tile_size, tilemap.chunk_px(), tuple(tilemap.tile_types), chunks, offgrid, compress)
+
+
+def write_atomic(path, data):
+    """
+    Writes a file through a temp file renamed over it, so a crash never leaves a half-written file
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def write_capture(capture, path):
+    """
+    Writes a MapCapture in the binary format, encoding only the chunks that were copied
+
+    return : dict of chunk key -> (revision, compress, record) of the encoded chunks, for Tilemap.merge_records
+    """
+    chunk_px = capture.chunk_px
+    type_ids = {name: t_id for t_id, name in enumerate(capture.tile_types)}
+    offgrid = {}
+    for order, tile in enumerate(capture.offgrid):
+        key = (int(tile['pos'][0] // chunk_px), int(tile['pos'][1] // chunk_px))
+        offgrid.setdefault(key, []).append((order, tile))
+    chunks = {chunk[0]: chunk for chunk in capture.chunks}
+
+    # les ids de la Tilemap servent directement d'ids dans le fichier
+    names = capture.tile_types[1:]
+
+    out = io.BytesIO()
+    out.seek(HEADER.size)
+    for name in names:
+        encoded = name.encode()
+        out.write(NAME_LENGTH.pack(len(encoded)))
+        out.write(encoded)
+
+    index = []
+    records = {}
+    for key in sorted(set(chunks) | set(offgrid)):
+        grid_offset = out.tell()
+        grid_size = count = 0
+        if key in chunks:
+            _, count, revision, grid, record = chunks[key]
+            if record is None:
+                record = zlib.compress(grid) if capture.compress else grid
+                records[key] = (revision, capture.compress, record)
+            out.write(record)
+            grid_size = len(record)
+        offgrid_offset = out.tell()
+        tiles = offgrid.get(key, [])
+        for order, tile in tiles:
+            out.write(OFFGRID_RECORD.pack(order, type_ids[tile['type']], tile['variant'], tile['pos'][0], tile['pos'][1]))
+        index.append((key[0], key[1], grid_offset, grid_size, count, offgrid_offset, len(tiles)))
+
+    index_offset = out.tell()
+    for entry in index:
+        out.write(INDEX_ENTRY.pack(*entry))
+    out.seek(0)
+    out.write(HEADER.pack(MAGIC, VERSION, FLAG_ZLIB if capture.compress else 0, capture.tile_size, len(names), len(index), index_offset))
+
+    write_atomic(path, out.getbuffer())
+    return records
+
+
+def write_map(tilemap, path, compress=True):
+    """
+    Writes a Tilemap in the binary format, atomically (temp file then os.replace)
+    """
+    return write_capture(capture_map(tilemap, compress), path)
+
+
+class MapFile:
+    """
+    Memory-mapped binary map, decoding chunks on demand
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.flags, self.tile_size, type_count, chunk_count, index_offset = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.data.close()
+            raise ValueError(path + " is not a binary map")
+
+        self.types = [None]
+        offset = HEADER.size
+        for _ in range(type_count):
+            length = self.data[offset]
+            self.types.append(self.data[offset + 1:offset + 1 + length].decode())
+            offset += 1 + length
+
+        # cle du chunk -> (position, taille, nombre de cases, position hors grille, nombre hors grille)
+        self.index = {}
+        for i in range(chunk_count):
+            cx, cy, *entry = INDEX_ENTRY.unpack_from(self.data, index_offset + i * INDEX_ENTRY.size)
+            self.index[(cx, cy)] = entry
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def type_lut(self, tilemap):
+        """
+        Returns the bytes.translate table mapping the type ids of the file to the ids of a Tilemap
+        """
+        return bytes([tilemap.type_id(name) if name else 0 for name in self.types]).ljust(256, b'\0')
+
+    def read_grid(self, key):
+        """
+        return : (types, variants, count) of a chunk, None if it has no grid tile
+        """
+        grid_offset, grid_size, count, _, _ = self.index[key]
+        if not grid_size:
+            return None
+        data = self.data[grid_offset:grid_offset + grid_size]
+        if self.flags & FLAG_ZLIB:
+            data = zlib.decompress(data)
+        half = len(data) // 2
+        return data[:half], data[half:], count
+
+    def read_offgrid(self, key):
+        """
+        return : list of (order, tile) for the off-grid tiles whose position is in the chunk,
+                 order being the position of the tile in Tilemap.offgrid when it was saved
+        """
+        _, _, _, offset, count = self.index[key]
+        tiles = []
+        for order, t_id, variant, x, y in OFFGRID_RECORD.iter_unpack(self.data[offset:offset + count * OFFGRID_RECORD.size]):
+            # les positions entieres du JSON restent entieres
+            tiles.append((order, {'type': self.types[t_id], 'variant': variant, 'pos': [int(x) if x.is_integer() else x, int(y) if y.is_integer() else y]}))
+        return tiles
+
+
+def convert(src, dst, compress=True):
+    """
+    Converts a map between the JSON and binary formats, according to the extension of dst
+    """
+    from scripts.tilemap import Tilemap
+    tilemap = Tilemap(None)
+    tilemap.load(src)
+    tilemap.save(dst, compress=compress)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python -m scripts.mapformat <source map> <target map>  (.json or .njm)')
+        sys.exit(2)
+    convert(sys.argv[1], sys.argv[2])
@@ -0,0 +1,98 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def autosave_path(path):
+    """
+    Returns the path of the autosave of a map: data/maps/3.json -> data/maps/3.autosave.json
+    (not a level name, so the LevelManager ignores it)
+    """
+    root, ext = os.path.splitext(path)
+    return root + '.autosave' + ext
+
+
+class MapSaver:
+    """
+    Saves a Tilemap without blocking the editor: the map is copied on the main
+    thread (Tilemap.capture), then encoded and written atomically by a background
+    thread. One save runs at a time, a save asked meanwhile starts after it.
+    """
+
+    def __init__(self, tilemap, path, compress=True):
+        """
+        :param path: target of the saves, its extension gives the format
+        :param compress: zlib compression of the chunks of the binary format
+        """
+        self.tilemap = tilemap
+        self.path = path
+        self.compress = compress
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        # chemin de la sauvegarde demandee pendant qu'une autre s'ecrivait
+        self.pending = None
+        # revision de la carte a la derniere sauvegarde sur path
+        self.saved_revision = tilemap.revision
+        self.running_revision = None
+        self.error = None
+
+    @property
+    def busy(self):
+        return self.future is not None or self.pending is not None
+
+    @property
+    def modified(self):
+        """
+        True if the map changed since it was last saved on path
+        """
+        return self.tilemap.revision != self.saved_revision
+
+    def save(self, path=None):
+        """
+        Starts saving the map (on self.path by default), or queues the save if one is running
+        """
+        path = path or self.path
+        if self.future is not None:
+            self.pending = path
+            return
+        # les records ne sont fusionnes qu'a la fin de la sauvegarde precedente : elles ne se chevauchent jamais
+        capture = self.tilemap.capture(path, self.compress)
+        self.running_revision = self.tilemap.revision if path == self.path else None
+        self.future = self.executor.submit(self.tilemap.write_capture, capture, path)
+
+    def poll(self):
+        """
+        Finishes the save that was written (to call every frame on the main thread)
+
+        return : True if a save finished successfully
+        """
+        if self.future is None or not self.future.done():
+            return False
+        future = self.future
+        self.future = None
+        done = False
+        try:
+            self.tilemap.merge_records(future.result())
+            if self.running_revision is not None:
+                self.saved_revision = self.running_revision
+            self.error = None
+            done = True
+        except OSError as e:
+            self.error = e
+            print("Map not saved :", e)
+        if self.pending is not None:
+            path, self.pending = self.pending, None
+            self.save(path)
+        return done
+
+    def wait(self):
+        """
+        Blocks until every asked save is written
+        """
+        while self.future is not None:
+            # exception() attend la fin de l'ecriture sans lever l'erreur, geree par poll
+            self.future.exception()
+            self.poll()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
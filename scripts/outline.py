@@ -0,0 +1,57 @@
+import numpy as np
+import pygame
+
+OUTLINE_OFFSETS = [(1,0), (-1,0), (0,1), (0,-1)]
+
+class Outline:
+    """
+    Draws a dark silhouette of everything visible on a surface, shifted by one
+    pixel in each direction, to outline the scene.
+
+    The silhouette surface and the mask buffer are allocated once and reused
+    every frame, and only the area where something was drawn is processed.
+    """
+
+    def __init__(self, size, color=(0, 0, 0, 180), threshold=127):
+        """
+        :param size: size of the surfaces that will be outlined
+        :param color: RGBA color of the silhouette
+        :param threshold: pixels with an alpha above it are part of the silhouette (same as pygame.mask.from_surface)
+        """
+        self.size = tuple(size)
+        self.alpha = color[3]
+        self.threshold = threshold
+        self.silhouette = pygame.Surface(self.size, pygame.SRCALPHA)
+        self.silhouette.fill((color[0], color[1], color[2], 0))
+        # surfarray indexe en (x, y) : on travaille sur les vues transposees (y, x), dans l'ordre de la memoire
+        self.mask = np.empty((self.size[1], self.size[0]), dtype=bool)
+        # zone de la silhouette non vide
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+    def update(self, surf):
+        """
+        Rebuilds the silhouette from the alpha channel of surf
+        """
+        rect = surf.get_bounding_rect(min_alpha=self.threshold + 1)
+        # il faut aussi effacer ce qui restait de la frame precedente
+        dirty = rect.union(self.rect) if self.rect.size != (0, 0) else rect
+        self.rect = rect
+        if dirty.size == (0, 0):
+            return
+        area = (slice(dirty.top, dirty.bottom), slice(dirty.left, dirty.right))
+        mask = self.mask[area]
+
+        src_alpha = pygame.surfarray.pixels_alpha(surf).T
+        np.greater(src_alpha[area], self.threshold, out=mask)
+        # les vues bloquent les surfaces, il faut les liberer avant de blit
+        del src_alpha
+
+        sil_alpha = pygame.surfarray.pixels_alpha(self.silhouette).T
+        np.multiply(mask, self.alpha, out=sil_alpha[area], casting='unsafe')
+        del sil_alpha
+
+    def render(self, surf, offsets=OUTLINE_OFFSETS):
+        if self.rect.size == (0, 0):
+            return
+        for offset in offsets:
+            surf.blit(self.silhouette, (self.rect.x + offset[0], self.rect.y + offset[1]), self.rect)
@@ -0,0 +1,98 @@
+import math
+import random
+from collections import namedtuple
+
+import pygame
+
+# bande de profondeur du fond : facteur de parallaxe, vitesse des nuages (pixels par tick), nombre de nuages
+CloudLayer = namedtuple('CloudLayer', ['depth', 'speed', 'count'])
+
+# comme le fond d'origine : 8 nuages de profondeur 0.2 a 0.8
+CLOUD_LAYERS = (CloudLayer(0.25, 0.05, 3), CloudLayer(0.45, 0.07, 3), CloudLayer(0.7, 0.1, 2))
+
+
+class ParallaxLayer:
+    """
+    The clouds of one depth band, drawn once in a tile that wraps around in both
+    directions, so the layer is drawn with at most 4 blits whatever its cloud count
+    """
+
+    def __init__(self, layer, cloud_images, size, rng):
+        """
+        :param layer: CloudLayer
+        :param size: size of the surface the layer is drawn on
+        :param rng: random.Random used to place the clouds
+        """
+        self.depth = layer.depth
+        self.speed = layer.speed
+        self.x = 0.0
+        # un nuage peut sortir completement de l'ecran avant de revenir de l'autre cote
+        width = size[0] + max(img.get_width() for img in cloud_images)
+        height = size[1]
+        self.tile = pygame.Surface((width, height))
+        self.tile.fill((0, 0, 0))
+        for _ in range(layer.count):
+            img = rng.choice(cloud_images)
+            x = rng.random() * width
+            y = rng.random() * height
+            # les nuages a cheval sur un bord sont dessines des deux cotes
+            for dx in (0, -width):
+                for dy in (0, -height):
+                    self.tile.blit(img, (x + dx, y + dy))
+        self.tile.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+
+    def update(self):
+        self.x = (self.x + self.speed) % self.tile.get_width()
+
+    def offset(self, scroll):
+        """
+        Returns the integer position of the tile for a camera position
+        """
+        return (math.floor(self.x - scroll[0] * self.depth) % self.tile.get_width(),
+                math.floor(-scroll[1] * self.depth) % self.tile.get_height())
+
+    def render(self, surf, offset):
+        width, height = self.tile.get_size()
+        surf.blits([(self.tile, (offset[0] - dx, offset[1] - dy)) for dx in (0, width) for dy in (0, height)], doreturn=False)
+
+
+class Parallax:
+    """
+    Background image and cloud layers, composited in a cached surface. The
+    composition is only done again when the integer offset of a layer changes,
+    otherwise the background costs a single blit.
+    """
+
+    def __init__(self, background, cloud_images, size, layers=CLOUD_LAYERS, seed=0):
+        """
+        :param background: image behind the clouds, scaled to size if needed
+        :param cloud_images: images of the clouds, black being transparent
+        :param size: size of the display
+        :param layers: CloudLayer of each depth band
+        :param seed: seed of the placement of the clouds (the game RNG is not used, the background is not part of the simulation)
+        """
+        self.background = background if background.get_size() == tuple(size) else pygame.transform.scale(background, size)
+        rng = random.Random(seed)
+        self.layers = [ParallaxLayer(layer, cloud_images, size, rng) for layer in sorted(layers, key=lambda layer: layer.depth)]
+        self.surface = pygame.Surface(size)
+        self.offsets = None
+
+    def update(self):
+        for layer in self.layers:
+            layer.update()
+
+    def get_state(self):
+        return tuple(layer.x for layer in self.layers)
+
+    def set_state(self, state):
+        for layer, x in zip(self.layers, state):
+            layer.x = x
+
+    def render(self, surf, offset=(0, 0)):
+        offsets = [layer.offset(offset) for layer in self.layers]
+        if offsets != self.offsets:
+            self.surface.blit(self.background, (0, 0))
+            for layer, layer_offset in zip(self.layers, offsets):
+                layer.render(self.surface, layer_offset)
+            self.offsets = offsets
+        surf.blit(self.surface, (0, 0))
@@ -1,28 +1,174 @@
-import pygame
+import numpy as np
 
 
-class Particle():
-    def __init__(self, game, p_type, pos, velocity=[0,0], frame = 0):
-        self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets['particles/'+self.type].copy()
-        self.animation.frame = frame
+class ParticleSystem:
+    """
+    All the particles of the game, stored as numpy struct-of-arrays so that
+    they are updated in one batch and drawn with a single Surface.blits call.
+    """
+
+    def __init__(self, animations, capacity=256):
+        """
+        :param animations: dict of particle type -> Animation
+        :param capacity: initial number of preallocated particles
+        """
+        self.type_ids = {}
+        self.images = []
+        base = []
+        img_dur = []
+        length = []
+        loop = []
+        for p_type, animation in animations.items():
+            self.type_ids[p_type] = len(base)
+            base.append(len(self.images))
+            self.images += animation.images
+            img_dur.append(animation.img_dur)
+            length.append(animation.length)
+            loop.append(animation.loop)
+
+        # donnees par type de particule
+        self.base = np.array(base, dtype=np.int32)
+        self.img_dur = np.array(img_dur, dtype=np.int32)
+        self.length = np.array(length, dtype=np.int32)
+        self.loop = np.array(loop, dtype=bool)
+        self.sway = np.array([p_type == 'leaf' for p_type in animations], dtype=bool)
+
+        # demi-taille de chaque image, pour centrer les particules
+        self.half_w = np.array([img.get_width() // 2 for img in self.images], dtype=np.int32)
+        self.half_h = np.array([img.get_height() // 2 for img in self.images], dtype=np.int32)
+
+        # donnees par particule
+        self.pos = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.frame = np.zeros(capacity, dtype=np.int32)
+        self.type = np.zeros(capacity, dtype=np.int8)
+        self.count = 0
+
+        # particules mortes pendant le dernier update, retirees au prochain
+        self.dead = None
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, n):
+        needed = self.count + n
+        capacity = len(self.frame)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('pos', 'velocity', 'frame', 'type'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def clear(self):
+        self.count = 0
+        self.dead = None
+
+    def get_state(self):
+        """
+        Returns a copy of the live part of the arrays
+        """
+        n = self.count
+        return (self.pos[:n].copy(), self.velocity[:n].copy(), self.frame[:n].copy(), self.type[:n].copy(),
+                None if self.dead is None else self.dead.copy())
+
+    def set_state(self, state):
+        pos, velocity, frame, p_type, dead = state
+        self.count = 0
+        self._reserve(len(frame))
+        n = self.count = len(frame)
+        self.pos[:n] = pos
+        self.velocity[:n] = velocity
+        self.frame[:n] = frame
+        self.type[:n] = p_type
+        self.dead = None if dead is None else dead.copy()
+
+    def spawn(self, p_type, pos, velocity=(0, 0), frame=0):
+        """
+        Adds one particle
+
+        :param p_type: particle type, 'leaf' or 'particle'
+        :param pos: position of the center of the particle
+        :param velocity: movement per frame
+        :param frame: starting frame of the animation
+        """
+        self._reserve(1)
+        i = self.count
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.frame[i] = frame
+        self.type[i] = self.type_ids[p_type]
+        self.count += 1
+
+    def spawn_many(self, p_type, positions, velocities, frames):
+        """
+        Adds a batch of particles of the same type, each argument being an array of n items
+        """
+        frames = np.asarray(frames)
+        n = len(frames)
+        self._reserve(n)
+        i = self.count
+        self.pos[i:i + n] = positions
+        self.velocity[i:i + n] = velocities
+        self.frame[i:i + n] = frames
+        self.type[i:i + n] = self.type_ids[p_type]
+        self.count += n
+
+    def _compact(self):
+        # les particules ajoutees depuis le dernier update sont vivantes
+        n = self.count
+        alive = np.ones(n, dtype=bool)
+        alive[:len(self.dead)] = ~self.dead
+        m = int(np.count_nonzero(alive))
+        if m != n:
+            self.pos[:m] = self.pos[:n][alive]
+            self.velocity[:m] = self.velocity[:n][alive]
+            self.frame[:m] = self.frame[:n][alive]
+            self.type[:m] = self.type[:n][alive]
+            self.count = m
+        self.dead = None
 
     def update(self):
-        kill = False
+        """
+        Moves and animates every particle. Particles whose animation was over are
+        still moved and rendered this frame, then removed on the next update.
+        """
+        if self.dead is not None:
+            self._compact()
+
+        n = self.count
+        if not n:
+            return
+
+        types = self.type[:n]
+        frame = self.frame[:n]
+        length = self.length[types]
+        loop = self.loop[types]
 
-        if self.animation.done:
-            kill = True
+        self.dead = ~loop & (frame >= length - 1)
 
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+        self.pos[:n] += self.velocity[:n]
 
-        self.animation.update()
+        frame += 1
+        np.remainder(frame, length, out=frame, where=loop)
+        np.minimum(frame, length - 1, out=frame)
 
-        return kill
+        # balancement des feuilles
+        sway = self.sway[types]
+        if sway.any():
+            self.pos[:n, 0][sway] += np.sin(frame[sway] * 0.035) * 0.3
 
     def render(self, surf, offset=(0, 0)):
-        img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width()//2, self.pos[1] - offset[1] - img.get_height()//2))
+        n = self.count
+        if not n:
+            return
+        types = self.type[:n]
+        img_ids = self.base[types] + self.frame[:n] // self.img_dur[types]
+        # astype(int) tronque vers 0, comme blit avec des positions flottantes
+        xs = (self.pos[:n, 0] - offset[0] - self.half_w[img_ids]).astype(np.int32)
+        ys = (self.pos[:n, 1] - offset[1] - self.half_h[img_ids]).astype(np.int32)
+        images = self.images
+        surf.blits([(images[i], (x, y)) for i, x, y in zip(img_ids.tolist(), xs.tolist(), ys.tolist())], doreturn=False)
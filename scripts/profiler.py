@@ -0,0 +1,194 @@
+import csv
+import itertools
+import json
+import time
+from collections import deque
+
+import pygame
+
+# nombre de frames resumees par l'overlay
+OVERLAY_FRAMES = 600
+
+class _Phase:
+    """Context manager timing one phase, reused every frame"""
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        current = self.profiler.current
+        current[self.name] = current.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+class _NullPhase:
+    """Used when the profiler is disabled: costs a method call and nothing else"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_PHASE = _NullPhase()
+
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile (0-100) of a list of values, with the nearest rank method
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, round(p / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+class FrameProfiler:
+    """
+    Measures the time spent in each phase of a frame, keeps the last frames,
+    draws them as an overlay and exports them to JSON or CSV.
+
+    A phase can be timed several times in a frame (update and render), the times add up.
+    """
+
+    def __init__(self, enabled=False, history=600, overlay=False):
+        """
+        :param enabled: if False, phase() and end_frame() do nothing
+        :param history: number of frames kept (None: every frame)
+        :param overlay: draw the overlay in render()
+        """
+        self.enabled = enabled or overlay
+        self.overlay = overlay
+        self.frames = deque(maxlen=history)
+        self.phase_names = []
+        self.timers = {}
+        self.current = {}
+        self.frame_start = None
+        self.frame_count = 0
+        self.font = None
+        self.overlay_lines = []
+        self.overlay_frame = None
+
+    def phase(self, name):
+        """
+        Returns a context manager timing the code of a phase
+
+            with profiler.phase('tilemap'):
+                tilemap.render(surf)
+        """
+        if not self.enabled:
+            return NULL_PHASE
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = _Phase(self, name)
+            self.phase_names.append(name)
+        return timer
+
+    def begin_frame(self):
+        self.current = {}
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self, **counts):
+        """
+        Stores the timings of the frame
+
+        :param counts: numbers to keep with the frame (entities, particles...)
+        """
+        if not self.enabled or self.frame_start is None:
+            return
+        frame_ms = (time.perf_counter() - self.frame_start) * 1000
+        self.frames.append((self.frame_count, frame_ms, {name: t * 1000 for name, t in self.current.items()}, counts))
+        self.frame_count += 1
+        self.frame_start = None
+
+    def toggle_overlay(self):
+        """
+        Shows or hides the overlay, showing it starts the profiling
+        """
+        self.overlay = not self.overlay
+        if self.overlay:
+            self.enabled = True
+
+    def summary(self, last=None):
+        """
+        Returns the mean time of each phase and the p50/p99 of the frame time, in ms
+
+        :param last: only summarize the last frames kept (all of them if None)
+        """
+        frames = self.frames
+        if last is not None and len(frames) > last:
+            frames = list(itertools.islice(frames, len(frames) - last, None))
+        n = len(frames)
+        phases = {name: 0.0 for name in self.phase_names}
+        for frame in frames:
+            for name, ms in frame[2].items():
+                phases[name] += ms
+        frame_times = [frame[1] for frame in frames]
+        return {
+            'frames': n,
+            'phases': {name: total / n if n else 0.0 for name, total in phases.items()},
+            'frame_p50': percentile(frame_times, 50),
+            'frame_p99': percentile(frame_times, 99),
+            'counts': frames[-1][3] if n else {},
+        }
+
+    def export_json(self, path):
+        data = {
+            'summary': self.summary(),
+            'frames': [{'frame': index, 'frame_ms': frame_ms, 'phases': phases, 'counts': counts} for index, frame_ms, phases, counts in self.frames],
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
+
+    def export_csv(self, path):
+        count_names = []
+        for frame in self.frames:
+            for name in frame[3]:
+                if name not in count_names:
+                    count_names.append(name)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'frame_ms'] + [name + '_ms' for name in self.phase_names] + count_names)
+            for index, frame_ms, phases, counts in self.frames:
+                writer.writerow([index, round(frame_ms, 4)] + [round(phases.get(name, 0.0), 4) for name in self.phase_names] + [counts.get(name, '') for name in count_names])
+
+    def export(self, path):
+        """
+        Exports the kept frames, as CSV if path ends with .csv, as JSON otherwise
+        """
+        if path.endswith('.csv'):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
+
+    def render(self, surf, pos=(4, 4)):
+        """
+        Draws the mean time of each phase, the counts and the frame time percentiles
+        """
+        if not self.overlay:
+            return
+        if self.font is None:
+            self.font = pygame.font.Font(None, 18)
+        # le texte n'est recalcule que deux fois par seconde
+        if self.overlay_frame is None or self.frame_count - self.overlay_frame >= 30:
+            self.overlay_frame = self.frame_count
+            summary = self.summary(OVERLAY_FRAMES)
+            lines = ['frame p50 %.2f ms  p99 %.2f ms' % (summary['frame_p50'], summary['frame_p99'])]
+            for name, ms in summary['phases'].items():
+                lines.append('%-12s %6.3f ms' % (name, ms))
+            lines.append('  '.join('%s %d' % (name, count) for name, count in summary['counts'].items()))
+            self.overlay_lines = [self.font.render(line, True, (255, 255, 255), (0, 0, 0)) for line in lines]
+
+        y = pos[1]
+        for text in self.overlay_lines:
+            surf.blit(text, (pos[0], y))
+            y += text.get_height()
@@ -0,0 +1,162 @@
+from collections import namedtuple
+
+import numpy as np
+
+# vitesse en pixels par tick, duree de vie en ticks
+ProjectileKind = namedtuple('ProjectileKind', ['speed', 'lifetime', 'image'])
+
+
+class ProjectileSystem:
+    """
+    All the projectiles of the game, stored as numpy arrays and moved, tested
+    against the tiles and against a target rect in one batch per tick.
+    """
+
+    def __init__(self, kinds, capacity=64):
+        """
+        :param kinds: dict of name -> ProjectileKind
+        :param capacity: initial number of preallocated projectiles
+        """
+        self.kind_ids = {}
+        self.images = []
+        for name, kind in kinds.items():
+            self.kind_ids[name] = len(self.images)
+            self.images.append(kind.image)
+        self.speed = np.array([kind.speed for kind in kinds.values()], dtype=float)
+        self.lifetime = np.array([kind.lifetime for kind in kinds.values()], dtype=np.int32)
+        self.half_w = np.array([image.get_width() / 2 for image in self.images])
+        self.half_h = np.array([image.get_height() / 2 for image in self.images])
+
+        self.pos = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.timer = np.zeros(capacity, dtype=np.int32)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.count = 0
+
+        # nombre de projectiles tires depuis la creation (ou le dernier reset_stats)
+        self.fired = 0
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, n):
+        needed = self.count + n
+        capacity = len(self.timer)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('pos', 'velocity', 'timer', 'kind'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def clear(self):
+        self.count = 0
+
+    def reset_stats(self):
+        self.fired = 0
+
+    def spawn(self, pos, direction, kind='bullet'):
+        """
+        Fires one projectile
+
+        :param pos: starting position (center of the projectile)
+        :param direction: (dx, dy) unit vector, multiplied by the speed of the kind
+        """
+        self._reserve(1)
+        i = self.count
+        k = self.kind_ids[kind]
+        self.pos[i] = pos
+        self.velocity[i, 0] = direction[0] * self.speed[k]
+        self.velocity[i, 1] = direction[1] * self.speed[k]
+        self.timer[i] = 0
+        self.kind[i] = k
+        self.count += 1
+        self.fired += 1
+
+    def spawn_many(self, positions, directions, kind='bullet'):
+        """
+        Fires a batch of projectiles of the same kind, positions and directions being arrays of shape (n, 2)
+        """
+        directions = np.asarray(directions, dtype=float)
+        n = len(directions)
+        self._reserve(n)
+        i = self.count
+        k = self.kind_ids[kind]
+        self.pos[i:i + n] = positions
+        self.velocity[i:i + n] = directions * self.speed[k]
+        self.timer[i:i + n] = 0
+        self.kind[i:i + n] = k
+        self.count += n
+        self.fired += n
+
+    def get_state(self):
+        n = self.count
+        return (self.pos[:n].copy(), self.velocity[:n].copy(), self.timer[:n].copy(), self.kind[:n].copy())
+
+    def set_state(self, state):
+        pos, velocity, timer, kind = state
+        self.count = 0
+        self._reserve(len(timer))
+        n = self.count = len(timer)
+        self.pos[:n] = pos
+        self.velocity[:n] = velocity
+        self.timer[:n] = timer
+        self.kind[:n] = kind
+
+    def update(self, tilemap, target=None):
+        """
+        Moves every projectile, then removes the ones that hit a solid tile, that are
+        too old or that hit the target.
+
+        :param tilemap: Tilemap whose physics tiles stop the projectiles
+        :param target: pygame.Rect hit by the projectiles (None if nothing can be hit)
+
+        return : list of (x, y, vx, vy, hit_target) of the projectiles that hit a tile or
+                 the target, in the order they were fired
+        """
+        n = self.count
+        if not n:
+            return []
+        pos = self.pos[:n]
+        timer = self.timer[:n]
+        pos += self.velocity[:n]
+        timer += 1
+
+        solid = tilemap.solid_check_many(pos[:, 0], pos[:, 1])
+        expired = ~solid & (timer > self.lifetime[self.kind[:n]])
+        removed = solid | expired
+        hit = np.zeros(n, dtype=bool)
+        if target is not None:
+            # collidepoint tronque les coordonnees vers 0
+            xs = pos[:, 0].astype(np.int64)
+            ys = pos[:, 1].astype(np.int64)
+            hit = ~removed & (xs >= target.left) & (xs < target.right) & (ys >= target.top) & (ys < target.bottom)
+            removed |= hit
+
+        impacts = []
+        if removed.any():
+            impact = solid | hit
+            velocity = self.velocity[:n][impact]
+            impacts = list(zip(pos[impact, 0].tolist(), pos[impact, 1].tolist(), velocity[:, 0].tolist(), velocity[:, 1].tolist(), hit[impact].tolist()))
+            alive = ~removed
+            m = int(np.count_nonzero(alive))
+            self.pos[:m] = pos[alive]
+            self.velocity[:m] = self.velocity[:n][alive]
+            self.timer[:m] = timer[alive]
+            self.kind[:m] = self.kind[:n][alive]
+            self.count = m
+        return impacts
+
+    def render(self, surf, offset=(0, 0)):
+        n = self.count
+        if not n:
+            return
+        kinds = self.kind[:n]
+        # astype(int) tronque vers 0, comme blit avec des positions flottantes
+        xs = (self.pos[:n, 0] - offset[0] - self.half_w[kinds]).astype(np.int32)
+        ys = (self.pos[:n, 1] - offset[1] - self.half_h[kinds]).astype(np.int32)
+        images = self.images
+        surf.blits([(images[k], (x, y)) for k, x, y in zip(kinds.tolist(), xs.tolist(), ys.tolist())], doreturn=False)
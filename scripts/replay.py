@@ -0,0 +1,122 @@
+import struct
+
+from scripts.inputs import FrameInput
+
+# en-tete : magic, version, seed, niveau de depart, nombre de ticks, nombre de checksums, resolution du jeu
+HEADER = struct.Struct('<4sHQHIIHH')
+MAGIC = b'NJRP'
+# version 2 : checksum des projectiles stockes dans des tableaux
+# version 3 : simulation simplifiee des ennemis loin de l'ecran
+# version 4 : les nuages n'utilisent plus le generateur de la simulation
+# version 5 : resolution dans l'en-tete, la camera et la simulation des ennemis en dependent
+# version 6 : tour de mise a jour des ennemis lointains fixe a leur apparition
+VERSION = 6
+
+# resolution des parties enregistrees sans la preciser, celle du jeu par defaut
+RESOLUTION = (320, 240)
+
+# un checksum de l'etat du jeu est enregistre tous les CHECK_INTERVAL ticks pour detecter les desyncs
+CHECK_INTERVAL = 60
+
+
+def encode_input(frame_input):
+    """
+    Packs a FrameInput into one byte (bit 0: left, 1: right, 2: jump, 3: dash)
+    """
+    return frame_input.left | (frame_input.right << 1) | (frame_input.jump << 2) | (frame_input.dash << 3)
+
+
+def decode_input(byte):
+    return FrameInput(bool(byte & 1), bool(byte & 2), bool(byte & 4), bool(byte & 8))
+
+
+class Recording:
+    """
+    Inputs of a game, tick by tick, with everything needed to play it again
+    """
+
+    def __init__(self, seed, level=0, inputs=None, checksums=None, resolution=RESOLUTION):
+        """
+        :param seed: seed of the game RNG
+        :param level: id of the first level
+        :param resolution: internal resolution of the game, the game must be played again with the same one
+        :param inputs: bytearray of encoded inputs, one byte per tick
+        :param checksums: Game.checksum() every CHECK_INTERVAL ticks
+        """
+        self.seed = seed
+        self.level = level
+        self.resolution = tuple(resolution)
+        self.inputs = bytearray() if inputs is None else inputs
+        self.checksums = [] if checksums is None else checksums
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def frame_inputs(self):
+        for byte in self.inputs:
+            yield decode_input(byte)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.seed, self.level, len(self.inputs), len(self.checksums), *self.resolution))
+            f.write(self.inputs)
+            f.write(struct.pack('<%dI' % len(self.checksums), *self.checksums))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, seed, level, tick_count, check_count, width, height = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(path + " is not a replay file")
+        offset = HEADER.size
+        inputs = bytearray(data[offset:offset + tick_count])
+        offset += tick_count
+        checksums = list(struct.unpack_from('<%dI' % check_count, data, offset))
+        return cls(seed, level, inputs, checksums, (width, height))
+
+
+class InputRecorder:
+    """
+    Records the inputs given to Game.step, to be saved as a Recording
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.recording = Recording(game.seed, game.level, resolution=game.display.get_size())
+
+    def record(self, frame_input):
+        """
+        Records the input of a tick, to call after game.step(frame_input)
+        """
+        self.recording.inputs.append(encode_input(frame_input))
+        if len(self.recording.inputs) % CHECK_INTERVAL == 0:
+            self.recording.checksums.append(self.game.checksum())
+
+    def save(self, path):
+        self.recording.save(path)
+
+
+def replay(game, recording, render=False):
+    """
+    Plays a recording on a new game as fast as possible
+
+    :param game: Game created with the seed and level of the recording
+    :param recording: Recording to play
+    :param render: also draw each frame off-screen
+
+    return : tick of the first desync (None if the replay matched the recording)
+    """
+    checksums = iter(recording.checksums)
+    desync = None
+    for tick, frame_input in enumerate(recording.frame_inputs(), start=1):
+        game.profiler.begin_frame()
+        game.step(frame_input)
+        if render:
+            game.render()
+        game.end_profiler_frame()
+        if tick % CHECK_INTERVAL == 0:
+            expected = next(checksums, None)
+            if desync is None and expected is not None and expected != game.checksum():
+                desync = tick
+    return desync
@@ -0,0 +1,35 @@
+from collections import deque, namedtuple
+
+# etat complet de la simulation, voir Game.snapshot
+GameSnapshot = namedtuple('GameSnapshot', ['tick', 'level', 'dead', 'transition', 'screen_shake', 'won', 'scroll', 'player',
+                                           'enemies', 'projectiles', 'particles', 'sparks', 'background', 'rng'])
+
+
+class SnapshotRing:
+    """
+    Keeps the last snapshots of a game, to rewind it
+    """
+
+    def __init__(self, capacity=600):
+        """
+        :param capacity: number of snapshots kept (600 = 10 seconds at 60 ticks per second)
+        """
+        self.snapshots = deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def push(self, snapshot):
+        self.snapshots.append(snapshot)
+
+    def clear(self):
+        self.snapshots.clear()
+
+    def rewind(self, ticks=1):
+        """
+        Drops the last ticks snapshots and returns the one before them (None if the ring is empty).
+        The returned snapshot stays in the ring.
+        """
+        for _ in range(min(ticks, len(self.snapshots) - 1)):
+            self.snapshots.pop()
+        return self.snapshots[-1] if self.snapshots else None
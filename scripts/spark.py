@@ -1,41 +1,148 @@
-import math 
+import math
+import numpy as np
 import pygame
 
-class Spark:
-    """A class to represent a spark particle"""
-    def __init__ (self, pos : tuple, angle:float, speed: float):
+class SparkSystem:
+    """A pool of spark particles stored in numpy arrays"""
+    def __init__(self, capacity=128):
         """
-        Initialize the spark particle
-        
-        :param pos: The position of the spark  
+        Initialize the spark pool
+
+        :param capacity: The initial number of preallocated sparks
+        """
+        self.pos = np.zeros((capacity, 2))
+        # (cos, sin) of the angle, computed once at spawn
+        self.direction = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)
+        self.count = 0
+
+        # sparks that stopped during the last update, removed on the next one
+        self.dead = None
+
+    def __len__(self):
+        return self.count
+
+    def _reserve(self, n):
+        needed = self.count + n
+        capacity = len(self.speed)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('pos', 'direction', 'speed'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:])
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def clear(self):
+        self.count = 0
+        self.dead = None
+
+    def get_state(self):
+        """
+        Return a copy of the live part of the arrays
+        """
+        n = self.count
+        return (self.pos[:n].copy(), self.direction[:n].copy(), self.speed[:n].copy(),
+                None if self.dead is None else self.dead.copy())
+
+    def set_state(self, state):
+        pos, direction, speed, dead = state
+        self.count = 0
+        self._reserve(len(speed))
+        n = self.count = len(speed)
+        self.pos[:n] = pos
+        self.direction[:n] = direction
+        self.speed[:n] = speed
+        self.dead = None if dead is None else dead.copy()
+
+    def spawn(self, pos, angle: float, speed: float):
+        """
+        Add a spark
+
+        :param pos: The position of the spark
         :param angle: The angle of the spark
         :param speed: The speed of the spark
         """
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
-    
+        self._reserve(1)
+        i = self.count
+        self.pos[i] = pos
+        self.direction[i] = (math.cos(angle), math.sin(angle))
+        self.speed[i] = speed
+        self.count += 1
+
+    def spawn_many(self, positions, angles, speeds):
+        """
+        Add a batch of sparks, each argument being an array of n items
+        """
+        angles = np.asarray(angles, dtype=float)
+        n = len(angles)
+        self._reserve(n)
+        i = self.count
+        self.pos[i:i + n] = positions
+        self.direction[i:i + n, 0] = np.cos(angles)
+        self.direction[i:i + n, 1] = np.sin(angles)
+        self.speed[i:i + n] = speeds
+        self.count += n
+
+    def _compact(self):
+        # sparks spawned since the last update are alive
+        n = self.count
+        alive = np.ones(n, dtype=bool)
+        alive[:len(self.dead)] = ~self.dead
+        m = int(np.count_nonzero(alive))
+        if m != n:
+            self.pos[:m] = self.pos[:n][alive]
+            self.direction[:m] = self.direction[:n][alive]
+            self.speed[:m] = self.speed[:n][alive]
+            self.count = m
+        self.dead = None
+
     def update(self) -> None:
         """
-        Update the spark's position and speed
+        Update the position and speed of every spark. Sparks that stopped are
+        still rendered this frame and removed on the next update.
         """
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
+        if self.dead is not None:
+            self._compact()
 
-        self.speed = max(0, self.speed - 0.1)   
-        return not self.speed
+        n = self.count
+        if not n:
+            return
 
+        speed = self.speed[:n]
+        self.pos[:n] += self.direction[:n] * speed[:, None]
+        np.maximum(speed - 0.1, 0, out=speed)
+        self.dead = speed == 0
 
+    def polygons(self, offset=(0, 0)):
+        """
+        Return the 4 vertices of every spark, as an array of shape (n, 4, 2)
+        """
+        n = self.count
+        pos = self.pos[:n] - offset
+        direction = self.direction[:n]
+        speed = self.speed[:n, None]
+        along = direction * speed * 3
+        # direction rotated by pi/2: (cos(a + pi/2), sin(a + pi/2)) = (-sin(a), cos(a))
+        across = np.empty_like(direction)
+        across[:, 0] = -direction[:, 1]
+        across[:, 1] = direction[:, 0]
+        across *= speed * 0.5
+
+        points = np.empty((n, 4, 2))
+        points[:, 0] = pos + along
+        points[:, 1] = pos + across
+        points[:, 2] = pos - along
+        points[:, 3] = pos - across
+        return points
 
     def render(self, surf, offset=(0, 0)):
         """
-        Render the spark on the screen
+        Render every spark on the screen
         """
-        render_points = [
-            (self.pos[0] + math.cos(self.angle)*self.speed*3 - offset[0],self.pos[1] + math.sin(self.angle)*self.speed*3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi/2)*self.speed*0.5 - offset[0],self.pos[1] + math.sin(self.angle + math.pi/2)*self.speed*0.5 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi)*self.speed*3 - offset[0],self.pos[1] + math.sin(self.angle + math.pi)*self.speed*3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle - math.pi/2)*self.speed*0.5 - offset[0],self.pos[1] + math.sin(self.angle - math.pi/2)*self.speed*0.5 - offset[1])
-        ]
-
-        pygame.draw.polygon(surf, (255,255,255), render_points)
\ No newline at end of file
+        if not self.count:
+            return
+        for points in self.polygons(offset).tolist():
+            pygame.draw.polygon(surf, (255,255,255), points)
@@ -0,0 +1,145 @@
+class SpatialHash:
+    """
+    Uniform grid index: every item is stored in each cell its rect covers,
+    so a query only looks at the items near the queried area.
+    """
+
+    def __init__(self, cell_size=64):
+        """
+        :param cell_size: size of a cell in pixels
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+        # item_id -> (x, y, w, h, cell bounds)
+        self.items = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item_id):
+        return item_id in self.items
+
+    def _bounds(self, x, y, w, h):
+        cs = self.cell_size
+        return (int(x // cs), int(y // cs), int((x + w) // cs), int((y + h) // cs))
+
+    def insert(self, item_id, rect):
+        """
+        Adds an item to the index
+
+        :param item_id: any hashable identifier
+        :param rect: (x, y, w, h) of the item, floats are allowed
+        """
+        x, y, w, h = rect
+        bounds = self._bounds(x, y, w, h)
+        self.items[item_id] = (x, y, w, h, bounds)
+        cells = self.cells
+        for cx in range(bounds[0], bounds[2] + 1):
+            for cy in range(bounds[1], bounds[3] + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    cells[(cx, cy)] = {item_id}
+                else:
+                    cell.add(item_id)
+
+    def remove(self, item_id):
+        bounds = self.items.pop(item_id)[4]
+        cells = self.cells
+        for cx in range(bounds[0], bounds[2] + 1):
+            for cy in range(bounds[1], bounds[3] + 1):
+                cell = cells[(cx, cy)]
+                cell.discard(item_id)
+                if not cell:
+                    del cells[(cx, cy)]
+
+    def move(self, item_id, rect):
+        """
+        Updates the rect of an item, the cells are only touched if it changed cells
+        """
+        x, y, w, h = rect
+        bounds = self._bounds(x, y, w, h)
+        if self.items[item_id][4] == bounds:
+            self.items[item_id] = (x, y, w, h, bounds)
+        else:
+            self.remove(item_id)
+            self.insert(item_id, rect)
+
+    def rect(self, item_id):
+        return self.items[item_id][:4]
+
+    def query(self, rect):
+        """
+        Returns the set of item ids whose rect overlaps the given rect
+        """
+        qx, qy, qw, qh = rect
+        bounds = self._bounds(qx, qy, qw, qh)
+        cells = self.cells
+        items = self.items
+        found = set()
+        for cx in range(bounds[0], bounds[2] + 1):
+            for cy in range(bounds[1], bounds[3] + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    continue
+                for item_id in cell:
+                    if item_id in found:
+                        continue
+                    x, y, w, h = items[item_id][:4]
+                    if x < qx + qw and qx < x + w and y < qy + qh and qy < y + h:
+                        found.add(item_id)
+        return found
+
+    def query_point(self, pos):
+        """
+        Returns the set of item ids whose rect contains the given point
+        """
+        px, py = pos
+        cs = self.cell_size
+        cell = self.cells.get((int(px // cs), int(py // cs)))
+        found = set()
+        if cell is not None:
+            for item_id in cell:
+                x, y, w, h = self.items[item_id][:4]
+                if x <= px < x + w and y <= py < y + h:
+                    found.add(item_id)
+        return found
+
+
+class Broadphase:
+    """
+    Named layers of SpatialHash with the same cell size, one per kind of
+    object (enemies, trigger rects...), so a query only returns one kind.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.layers = {}
+
+    def layer(self, name):
+        """
+        Returns the SpatialHash of a layer, created empty if needed
+        """
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = SpatialHash(self.cell_size)
+        return layer
+
+    def clear(self, name):
+        self.layers[name] = SpatialHash(self.cell_size)
+
+    def insert(self, name, item_id, rect):
+        self.layer(name).insert(item_id, rect)
+
+    def move(self, name, item_id, rect):
+        self.layers[name].move(item_id, rect)
+
+    def remove(self, name, item_id):
+        self.layers[name].remove(item_id)
+
+    def query(self, name, rect):
+        layer = self.layers.get(name)
+        return layer.query(rect) if layer is not None else set()
+
+    def query_point(self, name, pos):
+        layer = self.layers.get(name)
+        return layer.query_point(pos) if layer is not None else set()
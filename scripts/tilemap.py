@@ -1,5 +1,10 @@
+import numpy as np
 import pygame
 import json
+import math
+
+from scripts.spatial import SpatialHash
+from scripts import mapformat
 
 AUTOTILE_MAP = {
     tuple() : 1,
@@ -13,102 +18,684 @@ AUTOTILE_MAP = {
     tuple(sorted([(0,-1), (1,0), (0,1)])) : 7,
     tuple(sorted([(1,0), (-1,0), (0,1), (0,-1)])) : 8,
 }
-    
+
+# bit de chaque voisin dans le masque de l'autotile
+AUTOTILE_BITS = {(1,0): 1, (0,1): 2, (-1,0): 4, (0,-1): 8}
+
+# masque des voisins de meme type -> variante (-1 : la variante n'est pas changee)
+AUTOTILE_LUT = np.full(16, -1, dtype=np.int16)
+for _neighbors, _variant in AUTOTILE_MAP.items():
+    AUTOTILE_LUT[sum(AUTOTILE_BITS[shift] for shift in _neighbors)] = _variant
+
 NEIGHBOR_OFFSETS = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (0, 0), (-1, 1), (0, 1), (1, 1)]
 PHYSICS_TILES = {'grass', 'stone'}
 AUTOTILE_TYPE = {'grass', 'stone'}
 
+# les tuiles sont rangees par chunks de CHUNK_SIZE x CHUNK_SIZE cases
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
+
+# nombre min de surfaces de chunks gardees en cache pour le rendu, par couche (voir Tilemap.set_view_size)
+RENDER_CACHE_LIMIT = 64
+
+
+class Chunk:
+    """
+    Bloc de CHUNK_SIZE x CHUNK_SIZE cases de la grille.
+
+    Le type (0 = case vide, sinon index dans Tilemap.tile_types) et la variante
+    de chaque case sont stockes dans deux bytearray indexes par (y * CHUNK_SIZE + x).
+    Les rects de collision des cases sont crees a la demande puis gardes dans rects.
+    """
+    __slots__ = ('types', 'variants', 'count', 'rects')
+
+    def __init__(self):
+        self.types = bytearray(CHUNK_AREA)
+        self.variants = bytearray(CHUNK_AREA)
+        self.count = 0
+        self.rects = None
+
+
 class Tilemap:
     def __init__(self, game, tile_size=16):
         self.game = game
         self.tile_size = tile_size
-        self.tilemap = {}
-        self.offgrid_tiles = []
+        self.chunks = {}
+
+        # tuiles hors grille : id -> tuile, indexees par une grille de la taille d'un chunk
+        self.offgrid = {}
+        self.offgrid_index = SpatialHash(self.chunk_px())
+        self.next_offgrid_id = 0
+
+        # cache de rendu : surfaces pre-calculees par chunk, pour la grille et pour les tuiles hors grille
+        self.grid_surfs = {}
+        self.offgrid_surfs = {}
+        self.render_cache_limit = RENDER_CACHE_LIMIT
+
+        # table des types de tuiles : l'id 0 est reserve aux cases vides
+        self.tile_types = [None]
+        self.type_ids = {}
+        self.solid_types = [False]
+
+        # liste reutilisee par physics_rect_around
+        self.rects_around = []
+
+        # carte binaire dont les chunks sont charges autour de la camera (voir stream)
+        self.stream_file = None
+        self.stream_lut = None
+        self.stream_radius = 0
+        self.streamed = {}
+
+        # revision : compteur incremente a chaque modification de la carte. Les chunks modifies
+        # retiennent la revision de leur derniere modification, les autres ont base_revision
+        self.revision = 0
+        self.base_revision = 0
+        self.revisions = {}
+        # record de la carte binaire de chaque chunk deja ecrit : cle -> (revision, compress, record)
+        self.records = {}
+
+    def type_id(self, tile_type):
+        """
+        Retourne l'id entier d'un type de tuile, en l'enregistrant si besoin
+        """
+        t_id = self.type_ids.get(tile_type)
+        if t_id is None:
+            t_id = len(self.tile_types)
+            self.tile_types.append(tile_type)
+            self.type_ids[tile_type] = t_id
+            self.solid_types.append(tile_type in PHYSICS_TILES)
+        return t_id
+
+    @property
+    def offgrid_tiles(self):
+        """
+        List of the off-grid tiles, in insertion order
+        """
+        return list(self.offgrid.values())
+
+    def clear(self):
+        self.chunks = {}
+        self.offgrid = {}
+        self.offgrid_index = SpatialHash(self.chunk_px())
+        self.invalidate_render()
+        # les records ecrits avant ne correspondent plus a rien
+        self.revision += 1
+        self.base_revision = self.revision
+        self.revisions = {}
+        self.records = {}
+
+    def _touch(self, key):
+        """
+        Marks a chunk as modified: its baked surface and its encoded record are outdated
+        """
+        self.grid_surfs.pop(key, None)
+        self.revision += 1
+        self.revisions[key] = self.revision
+
+    def chunk_revision(self, key):
+        return self.revisions.get(key, self.base_revision)
+
+    def merge_records(self, records):
+        """
+        Keeps the records encoded by mapformat.write_capture, except for the chunks modified since their capture
+        """
+        for key, record in records.items():
+            if self.chunk_revision(key) == record[0]:
+                self.records[key] = record
+
+    def invalidate_render(self):
+        """
+        Drops every baked chunk surface, they will be rebuilt on the next render
+        """
+        self.grid_surfs = {}
+        self.offgrid_surfs = {}
+
+    def chunk_px(self):
+        return CHUNK_SIZE * self.tile_size
+
+    def set_view_size(self, size):
+        """
+        Sizes the render cache for the surface the map is drawn on, so the chunks of a frame are never evicted while drawing it
+
+        :param size: (width, height) of the surface given to render
+        """
+        chunk_px = self.chunk_px()
+        # chunks parcourus par _render_layer, doubles pour garder ceux quittes par la camera
+        visible = (math.ceil(size[0] / chunk_px) + 2) * (math.ceil(size[1] / chunk_px) + 2)
+        self.render_cache_limit = max(RENDER_CACHE_LIMIT, 2 * visible)
+
+    def offgrid_rect(self, tile):
+        """
+        Returns the (x, y, w, h) area covered by an off-grid tile image
+        """
+        size = (self.tile_size, self.tile_size)
+        if self.game is not None and tile['type'] in self.game.assets:
+            size = self.game.assets[tile['type']][tile['variant']].get_size()
+        return (tile['pos'][0], tile['pos'][1], size[0], size[1])
+
+    def _invalidate_offgrid(self, tile_id):
+        bounds = self.offgrid_index.items[tile_id][4]
+        for cx in range(bounds[0], bounds[2] + 1):
+            for cy in range(bounds[1], bounds[3] + 1):
+                self.offgrid_surfs.pop((cx, cy), None)
+
+    def add_offgrid(self, tile):
+        """
+        Adds an off-grid tile ({'type', 'variant', 'pos'} in pixels)
+
+        return : id of the tile, used by remove_offgrid
+        """
+        tile_id = self.next_offgrid_id
+        self.next_offgrid_id += 1
+        self.offgrid[tile_id] = tile
+        self.offgrid_index.insert(tile_id, self.offgrid_rect(tile))
+        self._invalidate_offgrid(tile_id)
+        self.revision += 1
+        return tile_id
+
+    def remove_offgrid(self, tile_id):
+        self._invalidate_offgrid(tile_id)
+        self.offgrid_index.remove(tile_id)
+        self.revision += 1
+        return self.offgrid.pop(tile_id)
+
+    def query_offgrid(self, rect):
+        """
+        Returns the ids of the off-grid tiles overlapping a pixel rect (x, y, w, h), in insertion order
+        """
+        return sorted(self.offgrid_index.query(rect))
+
+    def offgrid_at(self, pos):
+        """
+        Returns the ids of the off-grid tiles under a pixel position
+        """
+        return sorted(self.offgrid_index.query_point(pos))
+
+    def get_tile(self, tile_pos):
+        """
+        Returns the tile at a given grid position, or None if the cell is empty
+
+        :param tile_pos: tuple of x and y grid coordinates
+        """
+        x, y = tile_pos
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is not None:
+            i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+            t_id = chunk.types[i]
+            if t_id:
+                return {'type': self.tile_types[t_id], 'variant': chunk.variants[i], 'pos': [x, y]}
+
+    def set_tile(self, tile_pos, tile_type, variant):
+        """
+        Places a tile at a given grid position, replacing any existing one
+
+        return : True if the cell changed (placing the tile it already holds does nothing)
+        """
+        x, y = tile_pos
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        t_id = self.type_id(tile_type)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk()
+        elif chunk.types[i] == t_id and chunk.variants[i] == variant:
+            return False
+        if not chunk.types[i]:
+            chunk.count += 1
+        chunk.types[i] = t_id
+        chunk.variants[i] = variant
+        self._touch(key)
+        return True
+
+    def remove_tile(self, tile_pos):
+        """
+        Removes the tile at a given grid position
+
+        return : True if a tile was removed
+        """
+        x, y = tile_pos
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return False
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if not chunk.types[i]:
+            return False
+        chunk.types[i] = 0
+        chunk.variants[i] = 0
+        chunk.count -= 1
+        self._touch(key)
+        if not chunk.count:
+            del self.chunks[key]
+        return True
+
+    def set_grid(self, grid, tile_types, origin=(0, 0), variants=None):
+        """
+        Replaces a whole block of cells at once with numpy, much faster than set_tile for generated maps
+
+        :param grid: 2D array (rows, columns) of indexes in tile_types, 0 for an empty cell
+        :param tile_types: list of tile types, tile_types[0] is not used
+        :param origin: grid position of grid[0, 0]
+        :param variants: 2D array of the variants of the cells (0 if None)
+        """
+        lut = np.array([0] + [self.type_id(tile_type) for tile_type in tile_types[1:]], dtype=np.uint8)
+        ids = lut[grid]
+        variants = np.zeros_like(ids) if variants is None else np.asarray(variants, dtype=np.uint8)
+        ox, oy = origin
+        height, width = ids.shape
+        for cy in range(oy >> CHUNK_SHIFT, ((oy + height - 1) >> CHUNK_SHIFT) + 1):
+            y0 = max(oy, cy << CHUNK_SHIFT)
+            y1 = min(oy + height, (cy + 1) << CHUNK_SHIFT)
+            for cx in range(ox >> CHUNK_SHIFT, ((ox + width - 1) >> CHUNK_SHIFT) + 1):
+                x0 = max(ox, cx << CHUNK_SHIFT)
+                x1 = min(ox + width, (cx + 1) << CHUNK_SHIFT)
+                block = ids[y0 - oy:y1 - oy, x0 - ox:x1 - ox]
+                key = (cx, cy)
+                chunk = self.chunks.get(key)
+                if chunk is None:
+                    if not block.any():
+                        continue
+                    chunk = self.chunks[key] = Chunk()
+                # partie du chunk couverte par le bloc
+                rows = slice(y0 - (cy << CHUNK_SHIFT), y1 - (cy << CHUNK_SHIFT))
+                columns = slice(x0 - (cx << CHUNK_SHIFT), x1 - (cx << CHUNK_SHIFT))
+                chunk_types = np.frombuffer(chunk.types, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE)
+                chunk_types[rows, columns] = block
+                np.frombuffer(chunk.variants, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE)[rows, columns] = variants[y0 - oy:y1 - oy, x0 - ox:x1 - ox]
+                chunk.count = int(np.count_nonzero(chunk_types))
+                self._touch(key)
+                if not chunk.count:
+                    del self.chunks[key]
+
+    def tiles(self, only_types=None):
+        """
+        Iterates over every grid tile as {'type', 'variant', 'pos'} dicts
+
+        :param only_types: if given, only the chunks holding a tile of one of these types are scanned
+        """
+        tile_types = self.tile_types
+        wanted = None if only_types is None else [self.type_ids[t] for t in only_types if t in self.type_ids]
+        for (cx, cy), chunk in self.chunks.items():
+            types = chunk.types
+            if wanted is not None and not any(t_id in types for t_id in wanted):
+                continue
+            variants = chunk.variants
+            for i in range(CHUNK_AREA):
+                if types[i]:
+                    yield {'type': tile_types[types[i]], 'variant': variants[i], 'pos': [(cx << CHUNK_SHIFT) | (i & CHUNK_MASK), (cy << CHUNK_SHIFT) | (i >> CHUNK_SHIFT)]}
 
     def extract(self,id_pairs : tuple, keep=False):
         matches : list = []
-        for tile in self.offgrid_tiles.copy():
+        for tile_id, tile in list(self.offgrid.items()):
             if (tile['type'], tile['variant']) in id_pairs:
                 matches.append(tile.copy())
                 if not keep:
-                    self.offgrid_tiles.remove(tile)
-        for loc in list(self.tilemap.keys()).copy():
-            tile = self.tilemap[loc]
+                    self.remove_offgrid(tile_id)
+        for tile in list(self.tiles({tile_type for tile_type, _ in id_pairs})):
             if (tile['type'], tile['variant']) in id_pairs:
-                matches.append(tile.copy())
-                matches[-1]['pos'] = matches[-1]['pos'].copy()
-                matches[-1]['pos'][0] = matches[-1]['pos'][0] * self.tile_size
-                matches[-1]['pos'][1] = matches[-1]['pos'][1] * self.tile_size
                 if not keep:
-                    del self.tilemap[loc]
-        
+                    self.remove_tile(tile['pos'])
+                tile['pos'] = [tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size]
+                matches.append(tile)
+
         return matches
-    
-    def save(self,path):
-        f = open(path,'w')
-        json.dump({'tilemap':self.tilemap,'tile_size': self.tile_size, 'offgrid_tiles': self.offgrid_tiles},f)
-        f.close()
 
-    def load(self,path):
+    def save(self, path, compress=True):
+        """
+        Saves the map, in the binary format if path ends with mapformat.EXTENSION, in JSON otherwise.
+        The file is replaced atomically, and only the chunks modified since the last save to the
+        binary format are encoded again.
+
+        :param compress: zlib compression of the chunks of the binary format
+        """
+        self.merge_records(self.write_capture(self.capture(path, compress), path))
+
+    def capture(self, path, compress=True):
+        """
+        Copies the map for write_capture, which can then run in another thread (see MapSaver)
+        """
+        return mapformat.capture_map(self, compress, use_records=path.endswith(mapformat.EXTENSION))
+
+    @staticmethod
+    def write_capture(capture, path):
+        """
+        Writes a capture of the map, in the format given by the extension of path
+
+        return : the new chunk records, for merge_records
+        """
+        if path.endswith(mapformat.EXTENSION):
+            return mapformat.write_capture(capture, path)
+        tilemap = {}
+        for (cx, cy), _, _, grid, _ in capture.chunks:
+            for i in range(CHUNK_AREA):
+                t_id = grid[i]
+                if t_id:
+                    x = (cx << CHUNK_SHIFT) | (i & CHUNK_MASK)
+                    y = (cy << CHUNK_SHIFT) | (i >> CHUNK_SHIFT)
+                    tilemap[str(x) + ';' + str(y)] = {'type': capture.tile_types[t_id], 'variant': grid[CHUNK_AREA + i], 'pos': [x, y]}
+        data = json.dumps({'tilemap': tilemap, 'tile_size': capture.tile_size, 'offgrid_tiles': capture.offgrid})
+        mapformat.write_atomic(path, data.encode())
+        return {}
+
+    def load(self, path):
+        """
+        Loads a whole map, JSON or binary according to the extension of path
+        """
+        self.close_stream()
+        if path.endswith(mapformat.EXTENSION):
+            with mapformat.MapFile(path) as map_file:
+                self.tile_size = map_file.tile_size
+                self.clear()
+                lut = map_file.type_lut(self)
+                offgrid = []
+                for key in map_file.index:
+                    self._decode_grid(map_file, key, lut)
+                    offgrid += map_file.read_offgrid(key)
+                # meme ordre que dans la carte sauvegardee
+                offgrid.sort(key=lambda item: item[0])
+                for _, tile in offgrid:
+                    self.add_offgrid(tile)
+            return
         f = open(path,'r')
         data = json.load(f)
         f.close()
-        self.tilemap = data['tilemap']
         self.tile_size = data['tile_size']
-        self.offgrid_tiles = data['offgrid_tiles']
+        self.clear()
+        for tile in data['tilemap'].values():
+            self.set_tile(tile['pos'], tile['type'], tile['variant'])
+        for tile in data['offgrid_tiles']:
+            self.add_offgrid(tile)
+
+    def _decode_grid(self, map_file, key, lut):
+        grid = map_file.read_grid(key)
+        if grid is None:
+            return
+        chunk = Chunk()
+        chunk.types[:] = grid[0].translate(lut)
+        chunk.variants[:] = grid[1]
+        chunk.count = grid[2]
+        self.chunks[key] = chunk
+        self.grid_surfs.pop(key, None)
+
+    def stream(self, path, radius=2):
+        """
+        Opens a binary map without loading it: update_stream then decodes only the
+        chunks around the camera and drops the far ones, so the map can be much bigger
+        than what fits in memory as Python objects.
+
+        Streamed chunks are read-only, changes are lost when they are dropped, and save() raises
+        ValueError until close_stream().
+
+        :param radius: number of chunks kept loaded around the camera
+        """
+        self.close_stream()
+        self.stream_file = mapformat.MapFile(path)
+        self.tile_size = self.stream_file.tile_size
+        self.clear()
+        self.stream_lut = self.stream_file.type_lut(self)
+        self.stream_radius = radius
+        self.streamed = {}
+
+    def close_stream(self):
+        if self.stream_file is not None:
+            self.stream_file.close()
+            self.stream_file = None
+            self.streamed = {}
+
+    def update_stream(self, rect):
+        """
+        Loads the chunks around a pixel rect (x, y, w, h), usually the camera, and drops
+        the ones more than one chunk further than stream_radius
+        """
+        map_file = self.stream_file
+        if map_file is None:
+            return
+        chunk_px = self.chunk_px()
+        radius = self.stream_radius
+        left = int(rect[0] // chunk_px)
+        top = int(rect[1] // chunk_px)
+        right = int((rect[0] + rect[2]) // chunk_px)
+        bottom = int((rect[1] + rect[3]) // chunk_px)
+
+        for key in list(self.streamed):
+            # une marge d'un chunk evite de recharger en boucle a la limite
+            if not (left - radius - 1 <= key[0] <= right + radius + 1 and top - radius - 1 <= key[1] <= bottom + radius + 1):
+                for tile_id in self.streamed.pop(key):
+                    self.remove_offgrid(tile_id)
+                self.chunks.pop(key, None)
+                self.grid_surfs.pop(key, None)
+
+        for cx in range(left - radius, right + radius + 1):
+            for cy in range(top - radius, bottom + radius + 1):
+                key = (cx, cy)
+                if key in self.streamed or key not in map_file.index:
+                    continue
+                self._decode_grid(map_file, key, self.stream_lut)
+                self.streamed[key] = [self.add_offgrid(tile) for _, tile in map_file.read_offgrid(key)]
 
     def solid_check(self, pos):
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size))
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+        """
+        Returns True if the given pixel position is inside a physics tile
+        """
+        x = int(pos[0] // self.tile_size)
+        y = int(pos[1] // self.tile_size)
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is not None:
+            return self.solid_types[chunk.types[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]]
+        return False
+
+    def solid_check_many(self, xs, ys):
+        """
+        solid_check for arrays of pixel positions, looking up each chunk once
+
+        return : bool array
+        """
+        tile_x = np.floor_divide(xs, self.tile_size).astype(np.int64)
+        tile_y = np.floor_divide(ys, self.tile_size).astype(np.int64)
+        if not len(tile_x):
+            return np.zeros(0, dtype=bool)
+        # cle de chunk sur un seul entier : cx dans les 32 bits de poids fort, cy dans les 32 bits de poids faible
+        keys, inverse = np.unique(((tile_x >> CHUNK_SHIFT) << 32) | ((tile_y >> CHUNK_SHIFT) & 0xFFFFFFFF), return_inverse=True)
+        # types des chunks concernes mis bout a bout, les chunks absents etant vides
+        empty = bytes(CHUNK_AREA)
+        chunks = [self.chunks.get((key >> 32, ((key + 0x80000000) & 0xFFFFFFFF) - 0x80000000)) for key in keys.tolist()]
+        types = np.frombuffer(b''.join(empty if chunk is None else chunk.types for chunk in chunks), dtype=np.uint8)
+        cells = ((tile_y & CHUNK_MASK) << CHUNK_SHIFT) | (tile_x & CHUNK_MASK)
+        solid_types = np.array(self.solid_types, dtype=bool)
+        return solid_types[types[inverse.ravel() * CHUNK_AREA + cells]]
+
+    def _type_at(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is not None:
+            return chunk.types[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+        return 0
+
+    def autotile_ids(self):
+        return [self.type_ids[t] for t in AUTOTILE_TYPE if t in self.type_ids]
 
     def autotile(self):
-        for loc in self.tilemap.keys():
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1,0),(0,1),(-1,0),(0,-1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (neighbors in AUTOTILE_MAP) and (tile['type'] in AUTOTILE_TYPE):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
-            
+        """
+        Autotiles the whole map at once with numpy (used after loading or importing a map)
+        """
+        autotile_ids = self.autotile_ids()
+        keys = list(self.chunks)
+        if not autotile_ids or not keys:
+            return
+        chunks = [self.chunks[key] for key in keys]
+        n = len(keys)
+        # un chunk vide en plus, a l'index n, pour les voisins absents
+        types = np.zeros((n + 1, CHUNK_SIZE, CHUNK_SIZE), dtype=np.uint8)
+        types[:n] = np.frombuffer(b''.join(chunk.types for chunk in chunks), dtype=np.uint8).reshape(n, CHUNK_SIZE, CHUNK_SIZE)
+        rows = {key: row for row, key in enumerate(keys)}
+        right = np.array([rows.get((cx + 1, cy), n) for cx, cy in keys])
+        down = np.array([rows.get((cx, cy + 1), n) for cx, cy in keys])
+        left = np.array([rows.get((cx - 1, cy), n) for cx, cy in keys])
+        up = np.array([rows.get((cx, cy - 1), n) for cx, cy in keys])
+
+        # types des chunks entoures d'une bordure prise dans les chunks voisins
+        padded = np.zeros((n, CHUNK_SIZE + 2, CHUNK_SIZE + 2), dtype=np.uint8)
+        center = types[:n]
+        padded[:, 1:-1, 1:-1] = center
+        padded[:, 1:-1, -1] = types[right, :, 0]
+        padded[:, -1, 1:-1] = types[down, 0, :]
+        padded[:, 1:-1, 0] = types[left, :, -1]
+        padded[:, 0, 1:-1] = types[up, -1, :]
+
+        mask = (padded[:, 1:-1, 2:] == center).astype(np.intp)
+        mask |= (padded[:, 2:, 1:-1] == center) << 1
+        mask |= (padded[:, 1:-1, :-2] == center) << 2
+        mask |= (padded[:, :-2, 1:-1] == center) << 3
+        new_variants = AUTOTILE_LUT[mask]
+
+        variants = np.frombuffer(b''.join(chunk.variants for chunk in chunks), dtype=np.uint8).reshape(n, CHUNK_SIZE, CHUNK_SIZE)
+        changed = np.isin(center, autotile_ids) & (new_variants >= 0) & (variants != new_variants)
+        for row in np.flatnonzero(changed.any(axis=(1, 2))):
+            chunk_variants = np.frombuffer(chunks[row].variants, dtype=np.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE)
+            chunk_changed = changed[row]
+            chunk_variants[chunk_changed] = new_variants[row][chunk_changed]
+            self._touch(keys[row])
+
+    def autotile_at(self, tile_pos):
+        """
+        Autotiles a cell and its 4 neighbours, to call after placing or removing a tile
+        """
+        autotile_ids = self.autotile_ids()
+        x, y = tile_pos
+        self._autotile_cell(x, y, autotile_ids)
+        for shift in AUTOTILE_BITS:
+            self._autotile_cell(x + shift[0], y + shift[1], autotile_ids)
+
+    def _autotile_cell(self, x, y, autotile_ids):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        t_id = chunk.types[i]
+        if t_id not in autotile_ids:
+            return
+        mask = 0
+        for shift, bit in AUTOTILE_BITS.items():
+            if self._type_at(x + shift[0], y + shift[1]) == t_id:
+                mask |= bit
+        variant = AUTOTILE_LUT[mask]
+        if variant >= 0 and chunk.variants[i] != variant:
+            chunk.variants[i] = variant
+            self._touch(key)
+
     def tiles_around(self, pos):
         """
         Returns a list of tiles around a given position
 
         :param pos: tuple of x and y coordinates
-        
+
         return : list of tiles
         """
         tiles = []
         tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
+            tile = self.get_tile((tile_loc[0] + offset[0], tile_loc[1] + offset[1]))
+            if tile is not None:
+                tiles.append(tile)
         return tiles
-    
+
     def physics_rect_around(self, pos):
         """
         Returns a list of rects of physics tiles around a given position
+
+        The rects are cached per tile and the list is reused by the next call,
+        so neither must be modified or kept by the caller.
         """
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size, self.tile_size))
+        rects = self.rects_around
+        rects.clear()
+        tile_size = self.tile_size
+        tile_x = int(pos[0] // tile_size)
+        tile_y = int(pos[1] // tile_size)
+        chunks = self.chunks
+        solid_types = self.solid_types
+        for offset in NEIGHBOR_OFFSETS:
+            x = tile_x + offset[0]
+            y = tile_y + offset[1]
+            chunk = chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+            if chunk is None:
+                continue
+            i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+            if solid_types[chunk.types[i]]:
+                if chunk.rects is None:
+                    chunk.rects = [None] * CHUNK_AREA
+                rect = chunk.rects[i]
+                if rect is None:
+                    rect = chunk.rects[i] = pygame.Rect(x * tile_size, y * tile_size, tile_size, tile_size)
+                rects.append(rect)
         return rects
 
+    def _bake(self, blits):
+        """
+        Draws a list of (image, (x, y)) relative to a chunk origin into a new surface.
+        The surface is enlarged to the right and bottom for grid images overflowing the chunk.
+        """
+        width = height = self.chunk_px()
+        for img, pos in blits:
+            width = max(width, int(pos[0]) + img.get_width())
+            height = max(height, int(pos[1]) + img.get_height())
+        surf = pygame.Surface((width, height), pygame.SRCALPHA)
+        surf.blits(blits, doreturn=False)
+        return surf
+
+    def _bake_grid_chunk(self, key):
+        chunk = self.chunks[key]
+        assets = self.game.assets
+        tile_types = self.tile_types
+        blits = []
+        # meme ordre que le rendu case par case : colonne par colonne
+        for x in range(CHUNK_SIZE):
+            for y in range(CHUNK_SIZE):
+                i = (y << CHUNK_SHIFT) | x
+                t_id = chunk.types[i]
+                if t_id:
+                    blits.append((assets[tile_types[t_id]][chunk.variants[i]], (x * self.tile_size, y * self.tile_size)))
+        return self._bake(blits)
+
+    def _bake_offgrid_chunk(self, key):
+        # les tuiles qui debordent sur plusieurs chunks sont dessinees (et coupees) dans chacun d'eux
+        chunk_px = self.chunk_px()
+        assets = self.game.assets
+        blits = []
+        for tile_id in self.query_offgrid((key[0] * chunk_px, key[1] * chunk_px, chunk_px, chunk_px)):
+            tile = self.offgrid[tile_id]
+            # position arrondie avant de passer dans le repere du chunk : les morceaux d'une tuile a cheval se raccordent
+            x = math.floor(tile['pos'][0]) - key[0] * chunk_px
+            y = math.floor(tile['pos'][1]) - key[1] * chunk_px
+            blits.append((assets[tile['type']][tile['variant']], (x, y)))
+        surf = pygame.Surface((chunk_px, chunk_px), pygame.SRCALPHA)
+        surf.blits(blits, doreturn=False)
+        return surf
+
+    def _render_layer(self, surf, offset, sources, cache, bake):
+        chunk_px = self.chunk_px()
+        width, height = surf.get_size()
+        blits = []
+        # un chunk peut deborder sur ses voisins de droite et du bas, on commence donc un chunk avant
+        for cx in range(offset[0] // chunk_px - 1, (offset[0] + width) // chunk_px + 1):
+            for cy in range(offset[1] // chunk_px - 1, (offset[1] + height) // chunk_px + 1):
+                key = (cx, cy)
+                if key not in sources:
+                    continue
+                chunk_surf = cache.pop(key, None)
+                if chunk_surf is None:
+                    chunk_surf = bake(key)
+                # reinsere en fin de dict : les plus anciens sont evinces en premier
+                cache[key] = chunk_surf
+                pos = (cx * chunk_px - offset[0], cy * chunk_px - offset[1])
+                if pos[0] < width and pos[1] < height and pos[0] + chunk_surf.get_width() > 0 and pos[1] + chunk_surf.get_height() > 0:
+                    blits.append((chunk_surf, pos))
+        surf.blits(blits, doreturn=False)
+
+        while len(cache) > self.render_cache_limit:
+            del cache[next(iter(cache))]
+
     def render(self, surf, offset=(0, 0)):
-        for tile in self.offgrid_tiles:
-            surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
-            
-        for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                loc = str(x) + ';' + str(y)
-                if loc in self.tilemap:
-                    tile = self.tilemap[loc]
-                    surf.blit(self.game.assets[tile['type']][tile['variant']], (tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
\ No newline at end of file
+        self._render_layer(surf, offset, self.offgrid_index.cells, self.offgrid_surfs, self._bake_offgrid_chunk)
+        self._render_layer(surf, offset, self.chunks, self.grid_surfs, self._bake_grid_chunk)
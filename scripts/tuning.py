@@ -0,0 +1,26 @@
+from collections import namedtuple
+
+
+class Tuning(namedtuple('Tuning', ['walk_chance', 'walk_min', 'walk_max', 'dash_duration', 'dash_burst', 'dash_speed',
+                                   'projectile_speed', 'projectile_lifetime'])):
+    """
+    Gameplay constants tweaked by the level designers (see balance.py)
+
+    walk_chance: probability per tick that an idle enemy starts walking
+    walk_min, walk_max: bounds of the walk duration of an enemy, in ticks (an enemy shoots when it stops)
+    dash_duration: ticks between a dash and the next one
+    dash_burst: first ticks of the dash, during which the player moves at dash_speed, hits the enemies and cannot be hit
+    projectile_speed, projectile_lifetime: pixels per tick and ticks before a projectile disappears
+    """
+    __slots__ = ()
+
+    @property
+    def dash_end(self):
+        """
+        abs(Player.dashing) at the end of the burst of a dash
+        """
+        return self.dash_duration - self.dash_burst
+
+
+DEFAULT_TUNING = Tuning(walk_chance=0.01, walk_min=30, walk_max=120, dash_duration=60, dash_burst=10, dash_speed=8,
+                        projectile_speed=1.5, projectile_lifetime=360)
@@ -1,39 +1,54 @@
 import pygame
-import os 
 
 BASE_IMG_PATH = 'data/images/'
 
-def load_image(path):
-    img = pygame.image.load(BASE_IMG_PATH + path).convert()
-    img.set_colorkey((0, 0, 0))
-    return img
-
-def load_images(path):
-    images = []
-    for img_name in sorted(os.listdir(BASE_IMG_PATH + path)):
-        images.append(load_image(path + '/' + img_name))
-    return images
-
 class Animation:
+    """
+    Frames of an animation, shared by every entity playing it and never modified.
+    The horizontally flipped frames are computed once here instead of every render.
+    """
     def __init__(self,images,img_dur=5,loop=True):
         self.images = images
+        self.flipped = [pygame.transform.flip(img, True, False) for img in images]
         self.img_dur = img_dur
         self.loop = loop
+        self.length = len(images) * img_dur
+
+    def player(self):
+        """
+        Returns a new playback cursor on this animation
+        """
+        return AnimationPlayer(self)
+
+class AnimationPlayer:
+    """Position of an entity in a shared Animation"""
+    __slots__ = ('animation', 'frame', 'done')
+
+    def __init__(self, animation):
+        self.animation = animation
         self.frame = 0
         self.done = False
-    
-    def copy(self):
-        return Animation(self.images,self.img_dur,self.loop)
-    
+
     def update(self):
-        if self.loop:
-            self.frame = (self.frame + 1) % (len(self.images) * self.img_dur)
-        
+        if self.animation.loop:
+            self.frame = (self.frame + 1) % self.animation.length
+
         else:
-            self.frame = min(self.frame + 1, len(self.images)* self.img_dur - 1)
-            if self.frame >= len(self.images)* self.img_dur - 1:
+            self.frame = min(self.frame + 1, self.animation.length - 1)
+            if self.frame >= self.animation.length - 1:
                 self.done = True
-                
-    def img(self):
-        return self.images[int(self.frame)//self.img_dur]
-    
\ No newline at end of file
+
+    def img(self, flip=False):
+        animation = self.animation
+        return (animation.flipped if flip else animation.images)[self.frame // animation.img_dur]
+
+class SilentSound:
+    """Remplace pygame.mixer.Sound quand le jeu tourne sans son"""
+    def play(self, *args, **kwargs):
+        pass
+
+    def stop(self):
+        pass
+
+    def set_volume(self, volume):
+        pass